@@ -0,0 +1,145 @@
+"""
+Benchmark the price matrix preparation on synthetic data.
+
+Compares the per-cell path (pivot per persons group, then a
+`pivot.loc[row_id, date]` lookup with try/except for every hotel × date)
+against matrix_excel.prepare_matrix, checks both give the same cells — also
+after a round trip through matrix_pipeline.items_to_frame from DynamoDB-style
+Decimal prices — and times the full workbook build serially and in the sheet
+process pool.
+
+    python bench_matrix.py --hotels 50 --days 365 --repeat 3
+"""
+import argparse
+import io
+import time
+from decimal import Decimal
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import matrix_excel
+import matrix_pipeline
+
+VARIANTS = [(False, False), (False, True), (True, False), (True, True)]
+
+
+def synthetic_frame(hotels: int, days: int, persons_list: list, seed: int = 0) -> pd.DataFrame:
+    """Typed matrix frame of 2-decimal prices with ~10% of hotel × variant × date prices missing."""
+    rng   = np.random.default_rng(seed)
+    dates = pd.date_range("2025-01-01", periods=days)
+    parts = []
+    for persons in persons_list:
+        for h in range(hotels):
+            for bf, fc in VARIANTS:
+                keep = rng.random(days) > 0.1
+                parts.append(pd.DataFrame({
+                    "name":               f"Hotel {h:03d}",
+                    "price":              rng.uniform(60, 250, days).round(2)[keep],
+                    "checkin_date":       dates[keep],
+                    "hotel_url":          f"https://www.booking.com/hotel/fi/h{h}.html",
+                    "review_score":       8.1,
+                    "city":               "Tampere",
+                    "distance":           "1.2 km",
+                    "breakfast_included": bf,
+                    "free_cancellation":  fc,
+                    "persons":            persons,
+                }))
+    df = pd.concat(parts, ignore_index=True)
+    for col in ["name", "hotel_url", "city", "distance"]:
+        df[col] = df[col].astype("category")
+    return df
+
+
+def frame_from_items(df: pd.DataFrame) -> pd.DataFrame:
+    """The same rows as HotelPrices items (Decimal prices) read back through items_to_frame."""
+    items = [{"hotel_name": r.name, "price": Decimal(f"{r.price:.2f}"),
+              "checkin_date": r.checkin_date.strftime("%Y-%m-%d"), "hotel_url": r.hotel_url,
+              "review_score": Decimal(str(r.review_score)), "city": r.city, "distance": r.distance,
+              "breakfast_included": r.breakfast_included, "free_cancellation": r.free_cancellation,
+              "persons": r.persons}
+             for r in df.itertuples(index=False)]
+    frame = matrix_pipeline.items_to_frame(items).rename(columns={"price_date": "checkin_date"})
+    return frame[df.columns]
+
+
+def per_cell_prepare(df: pd.DataFrame, persons_list: list) -> list:
+    """The per-cell path: one pivot per persons group and a .loc lookup per cell."""
+    df = df.copy()
+    df["row_id"] = matrix_excel._row_ids(df)
+    all_dates = sorted(df["checkin_date"].unique())
+
+    rows = []
+    for persons in sorted(persons_list):
+        p_df = df[df["persons"] == persons].copy()
+        if p_df.empty:
+            continue
+        ordered = sorted(p_df["row_id"].unique())
+        pivot = p_df.pivot_table(index="row_id", columns="checkin_date",
+                                 values="price", aggfunc="first")
+        for row_id in ordered:
+            values = []
+            for date_str in all_dates:
+                try:
+                    val = pivot.loc[row_id, date_str]
+                    if pd.isna(val):
+                        raise KeyError
+                    values.append(round(float(val), 1))
+                except (KeyError, TypeError):
+                    values.append(None)
+            rows.append(values)
+    return rows
+
+
+def sheet_cells(xlsx: bytes) -> list:
+    """Every sheet's values and cell styles, for comparing two builds."""
+    wb = openpyxl.load_workbook(io.BytesIO(xlsx))
+    return [(ws.title, [(c.value, c.style, c.number_format, c.hyperlink.target if c.hyperlink else None)
+                        for row in ws.iter_rows() for c in row])
+            for ws in wb]
+
+
+def _best_of(fn, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--hotels", type=int, default=50)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--persons", nargs="+", type=int, default=[2])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    df = synthetic_frame(args.hotels, args.days, args.persons)
+    print(f"{len(df):,} price rows — {args.hotels} hotels × {len(VARIANTS)} variants × "
+          f"{args.days} days × persons {args.persons}")
+
+    t_cell, cell_rows = _best_of(lambda: per_cell_prepare(df, args.persons), args.repeat)
+    t_vec,  matrix    = _best_of(lambda: matrix_excel.prepare_matrix(df, args.persons), args.repeat)
+    same = cell_rows == matrix["prices"]
+    print(f"prepare  per-cell   {t_cell:8.3f} s")
+    print(f"prepare  vectorized {t_vec:8.3f} s   ({t_cell / t_vec:,.0f}× faster, identical cells: {same})")
+    same = cell_rows == matrix_excel.prepare_matrix(frame_from_items(df), args.persons)["prices"]
+    print(f"prepare  from items  identical cells: {same}")
+
+    t_xlsx, xlsx = _best_of(lambda: matrix_excel.build_matrix_xlsx(df, args.persons, parallel=False),
+                            args.repeat)
+    print(f"workbook serial     {t_xlsx:8.3f} s   ({len(xlsx) / 1e6:.1f} MB, 4 sheets)")
+
+    matrix_excel.build_matrix_xlsx(df, args.persons, parallel=True)   # start the worker pool
+    t_par, par = _best_of(lambda: matrix_excel.build_matrix_xlsx(df, args.persons, parallel=True),
+                          args.repeat)
+    same = sheet_cells(xlsx) == sheet_cells(par)
+    print(f"workbook parallel   {t_par:8.3f} s   ({matrix_excel.SHEET_WORKERS} workers, "
+          f"{t_xlsx / t_par:.1f}× serial, identical cells: {same})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
 import streamlit as st
 import boto3
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 import json
 import pytz
 import plotly.express as px
 from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
 import os
 import hashlib
 from decimal import Decimal
@@ -20,10 +22,19 @@ import email.mime.text
 import email.mime.base
 import email.encoders as _enc
 import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
-import smtplib
-from email.message import EmailMessage
+import socket
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import logging
+import hotel_mirror
+import mailer
+import matrix_cache
+import matrix_excel
+import matrix_pipeline
 
 st.set_page_config(
     page_title="Hotel Booking Dashboard",
@@ -168,6 +179,13 @@ region = st.secrets["AWS_DEFAULT_REGION"]
 # STD_TOP_VALUE = 600
 FINLAND_TZ = pytz.timezone('Europe/Helsinki')
 
+# Root of the local Parquet mirror of HotelPrices (see hotel_mirror.py); empty disables it
+HOTEL_MIRROR_DIR = st.secrets.get("HOTEL_MIRROR_DIR", "")
+
+# Disk cache of generated matrix files (see matrix_cache.py); empty disables it
+MATRIX_CACHE_DIR = st.secrets.get("MATRIX_CACHE_DIR",
+                                  os.path.join(tempfile.gettempdir(), "matrix_cache"))
+
 dynamodb = boto3.resource(
     'dynamodb',
     aws_access_key_id=aws_key,
@@ -184,6 +202,78 @@ table_config = dynamodb.Table('MickeAppConfig')
 table_zones = dynamodb.Table('MickeZones')
 table_emails = dynamodb.Table('MickeEmailList') 
 table_automations = dynamodb.Table('MickeAutomations')
+table_matrix_jobs = dynamodb.Table('MickeMatrixJobs')   # PK job_id; TTL attribute expires_at
+
+log = logging.getLogger("dashboard")
+for _logger in (log, matrix_pipeline.log):
+    if not _logger.handlers:
+        _log_handler = logging.StreamHandler()
+        _log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        _logger.addHandler(_log_handler)
+        _logger.setLevel(logging.INFO)
+
+
+@st.cache_resource
+def _price_store() -> matrix_pipeline.PriceStore:
+    """
+    Process-wide HotelPrices access shared by every session: per-thread
+    Table handles, the bounded query pool and the Parquet mirror. The
+    headless matrix runner builds the same object from the environment.
+    """
+    return matrix_pipeline.PriceStore(aws_key, aws_secret, region,
+                                      mirror_dir=HOTEL_MIRROR_DIR)
+
+
+def _thread_table(table_name: str):
+    """Per-thread Table handle for pool workers (boto3 resources are not thread-safe)."""
+    return _price_store().table(table_name)
+
+
+def _query_pool() -> ThreadPoolExecutor:
+    return _price_store().pool
+
+
+def _iter_pages(table_name: str, operation: str, jobs: list):
+    """
+    Run [(tag, request), ...] against `table_name` on the shared pool and
+    yield (tag, items, RCU) per page in arrival order; items is None once a
+    request has finished. Raises the first DynamoDB error.
+    """
+    return _price_store().iter_pages(table_name, operation, jobs)
+
+# ==================== PARALLEL SCAN ====================
+# Full-table reads are split into DynamoDB Segment/TotalSegments slices that
+# run concurrently on the query pool; pages are consumed as they arrive.
+
+SCAN_SEGMENTS = 4
+
+
+def _iter_scan_pages(tbl, total_segments: int, kwargs: dict):
+    jobs = [(segment, dict(kwargs, Segment=segment, TotalSegments=total_segments))
+            for segment in range(total_segments)]
+    for _, page, _ in _iter_pages(tbl.name, 'scan', jobs):
+        if page:
+            yield page
+
+
+def scan_items(tbl, total_segments: int = SCAN_SEGMENTS, **kwargs) -> list:
+    """Every item of a parallel scan (extra kwargs go to Table.scan). Order is not defined. Raises on errors."""
+    return [item for page in _iter_scan_pages(tbl, total_segments, kwargs) for item in page]
+
+
+def scan_frame(tbl, total_segments: int = SCAN_SEGMENTS, **kwargs) -> pd.DataFrame:
+    """Parallel scan straight into a DataFrame, one page-sized block at a time. Raises on errors."""
+    frames = [pd.DataFrame(page) for page in _iter_scan_pages(tbl, total_segments, kwargs)]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def scan_any(tbl, total_segments: int = SCAN_SEGMENTS, **kwargs) -> bool:
+    """True as soon as a parallel scan returns any item; the other segments stop after their current page. Raises on errors."""
+    pages = _iter_scan_pages(tbl, total_segments, kwargs)
+    try:
+        return next(pages, None) is not None
+    finally:
+        pages.close()
 
 # ==================== ZONE HELPER FUNCTIONS ====================
 
@@ -195,14 +285,7 @@ def get_zones_for_location(location: str) -> list:
     Cached 60 s to avoid hammering DynamoDB on every widget interaction.
     """
     try:
-        response = table_zones.scan(FilterExpression=Attr('location').eq(location))
-        items = response.get('Items', [])
-        while 'LastEvaluatedKey' in response:
-            response = table_zones.scan(
-                FilterExpression=Attr('location').eq(location),
-                ExclusiveStartKey=response['LastEvaluatedKey']
-            )
-            items.extend(response.get('Items', []))
+        items = scan_items(table_zones, FilterExpression=Attr('location').eq(location))
     except Exception as e:
         st.warning(f"Could not load zones for {location}: {e}")
         return []
@@ -215,11 +298,7 @@ def get_zones_for_location(location: str) -> list:
 def get_all_zones() -> list:
     """Return every zone row sorted by location → sort_order → zone_name."""
     try:
-        response = table_zones.scan()
-        items = response.get('Items', [])
-        while 'LastEvaluatedKey' in response:
-            response = table_zones.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-            items.extend(response.get('Items', []))
+        items = scan_items(table_zones)
         items.sort(key=lambda x: (x.get('location', ''),
                                    int(x.get('sort_order', 9999)),
                                    x.get('zone_name', '')))
@@ -294,11 +373,7 @@ def _resolve_zone_hotels(zone_name: str, location: str) -> list:
 def get_saved_emails() -> list:
     """Return all saved email addresses from the global list, sorted."""
     try:
-        resp  = table_emails.scan()
-        items = resp.get('Items', [])
-        while 'LastEvaluatedKey' in resp:
-            resp   = table_emails.scan(ExclusiveStartKey=resp['LastEvaluatedKey'])
-            items.extend(resp.get('Items', []))
+        items = scan_items(table_emails)
         return sorted([i['email'] for i in items if i.get('email')])
     except Exception as e:
         st.warning(f"Could not load email list: {e}")
@@ -329,6 +404,166 @@ def delete_email(email_address: str) -> bool:
         return False
     
 
+# ==================== LOGIN LOG FUNCTIONS ====================
+# MickeLoginLogs rows carry a 'login_month' bucket (YYYY-MM). The GSI below is
+# keyed login_month → login_ts, so an export queries one bucket per month in
+# the range and reads only the requested days:
+#   aws dynamodb update-table --table-name MickeLoginLogs \
+#     --attribute-definitions AttributeName=login_month,AttributeType=S AttributeName=login_ts,AttributeType=S \
+#     --global-secondary-index-updates '[{"Create":{"IndexName":"login_month-login_ts-index",
+#       "KeySchema":[{"AttributeName":"login_month","KeyType":"HASH"},{"AttributeName":"login_ts","KeyType":"RANGE"}],
+#       "Projection":{"ProjectionType":"ALL"}}}]'
+# Rows written before the bucket existed are filled in by backfill_login_months();
+# until none are left the index misses them, so exports keep scanning. The
+# MickeAppConfig flag below records that the table is fully bucketed.
+
+LOGIN_LOG_INDEX   = "login_month-login_ts-index"
+LOGIN_LOG_COLUMNS = ["username", "login_ts", "login_date"]
+LOGIN_BACKFILL_CONFIG_KEY = "login_month_backfill"
+
+
+def _month_buckets(start_date, end_date) -> list:
+    """'YYYY-MM' buckets covering [start_date, end_date], newest first."""
+    months = []
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months[::-1]
+
+
+def _iter_login_log_pages(start_date, end_date):
+    """
+    Query every month bucket in parallel and yield pages newest first:
+    each bucket is read in descending login_ts order and buckets are
+    released in month order as soon as all newer ones have finished.
+    """
+    months = _month_buckets(start_date, end_date)
+    key_range = Key("login_ts").between(start_date.strftime("%Y-%m-%d"),
+                                        end_date.strftime("%Y-%m-%d") + "~")
+    jobs = [(month, {
+                "IndexName": LOGIN_LOG_INDEX,
+                "KeyConditionExpression": Key("login_month").eq(month) & key_range,
+                "ScanIndexForward": False,
+            }) for month in months]
+
+    buffered = {month: [] for month in months}
+    finished = set()
+    next_i   = 0
+    for month, page, _ in _iter_pages(table_logs.name, "query", jobs):
+        if page is None:
+            finished.add(month)
+        else:
+            buffered[month].append(page)
+        while next_i < len(months):
+            current = months[next_i]
+            while buffered[current]:
+                yield buffered[current].pop(0)
+            if current not in finished:
+                break
+            next_i += 1
+
+
+def _scan_login_log_pages(start_date, end_date):
+    """Fallback for tables without the month index: filtered parallel scan, newest first."""
+    df_logs = scan_frame(
+        table_logs,
+        total_segments=matrix_pipeline.QUERY_POOL_WORKERS,
+        FilterExpression=Attr("login_date").between(
+            start_date.strftime("%Y-%m-%d"),
+            end_date.strftime("%Y-%m-%d")
+        )
+    )
+    if not df_logs.empty:
+        yield df_logs.sort_values("login_ts", ascending=False).to_dict("records")
+
+
+def _mark_login_logs_backfilled():
+    table_config.put_item(Item={"config_key": LOGIN_BACKFILL_CONFIG_KEY, "value": "complete",
+                                "completed_at": datetime.now(FINLAND_TZ).isoformat()})
+
+
+@st.cache_data(ttl=60)
+def login_logs_backfilled() -> bool:
+    """
+    True once every log row carries login_month. Reads the MickeAppConfig flag;
+    without it, a filtered scan stops at the first unbucketed row, and a table
+    found clean is flagged so later exports skip the check.
+    """
+    if table_config.get_item(Key={"config_key": LOGIN_BACKFILL_CONFIG_KEY}).get("Item"):
+        return True
+    if scan_any(table_logs, FilterExpression=Attr("login_month").not_exists()):
+        return False
+    _mark_login_logs_backfilled()
+    return True
+
+
+def export_login_logs(start_date, end_date) -> tuple:
+    """
+    Stream the login logs of [start_date, end_date] into a write-only xlsx.
+    Returns (xlsx bytes, row count, used_index). Falls back to a scan when
+    the login_month index does not exist yet or older rows have not been
+    backfilled (the index would silently miss them). Raises on other errors.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Login Logs")
+    ws.append(LOGIN_LOG_COLUMNS)
+
+    n_rows = 0
+    used_index = login_logs_backfilled()
+    if used_index:
+        try:
+            for page in _iter_login_log_pages(start_date, end_date):
+                for item in page:
+                    ws.append([str(item.get(col, "")) for col in LOGIN_LOG_COLUMNS])
+                    n_rows += 1
+        except ClientError as e:
+            # DynamoDB reports an unknown index as a ValidationException
+            if e.response["Error"]["Code"] not in ("ValidationException", "ResourceNotFoundException") or n_rows:
+                raise
+            used_index = False
+    if not used_index:
+        for page in _scan_login_log_pages(start_date, end_date):
+            for item in page:
+                ws.append([str(item.get(col, "")) for col in LOGIN_LOG_COLUMNS])
+                n_rows += 1
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue(), n_rows, used_index
+
+
+@st.cache_data(ttl=60)
+def login_log_index_status() -> str:
+    """IndexStatus of the login_month GSI ('ACTIVE', 'CREATING', …) or 'MISSING'."""
+    try:
+        for index in table_logs.meta.client.describe_table(
+                TableName=table_logs.name)["Table"].get("GlobalSecondaryIndexes", []):
+            if index["IndexName"] == LOGIN_LOG_INDEX:
+                return index.get("IndexStatus", "UNKNOWN")
+        return "MISSING"
+    except Exception:
+        return "UNKNOWN"
+
+
+def backfill_login_months() -> int:
+    """Add login_month to every log row that lacks it, then flag the table as backfilled. Returns rows updated."""
+    items = scan_items(table_logs, total_segments=matrix_pipeline.QUERY_POOL_WORKERS,
+                       FilterExpression=Attr("login_month").not_exists())
+    updated = 0
+    with table_logs.batch_writer() as batch:
+        for item in items:
+            login_date = item.get("login_date") or str(item.get("login_ts", ""))[:10]
+            if len(login_date) < 7:
+                continue
+            item["login_month"] = login_date[:7]
+            batch.put_item(Item=item)
+            updated += 1
+    _mark_login_logs_backfilled()
+    login_logs_backfilled.clear()
+    return updated
+
+
 # ==================== AUTOMATION HELPER FUNCTIONS ====================
  
 def finland_hour_to_utc(finland_hour: int) -> int:
@@ -357,26 +592,10 @@ def build_cron_expression(schedule_type: str, finland_hour: int,
         return f"cron(0 {utc_hour} ? * {day_of_week} *)"
  
  
-def _filter_desc_from_flags(breakfast: bool, free_cancel: bool) -> str:
-    """Return a consistent filter description string."""
-    if breakfast and free_cancel:
-        return "Breakfast_FreeCancel"
-    elif breakfast:
-        return "Breakfast"
-    elif free_cancel:
-        return "FreeCancel"
-    else:
-        return "NoExtras"
- 
- 
 def load_automations() -> list:
     """Scan all automation records from DynamoDB, sorted by name."""
     try:
-        resp  = table_automations.scan()
-        items = resp.get('Items', [])
-        while 'LastEvaluatedKey' in resp:
-            resp   = table_automations.scan(ExclusiveStartKey=resp['LastEvaluatedKey'])
-            items.extend(resp.get('Items', []))
+        items = scan_items(table_automations)
         return sorted(items, key=lambda x: x.get('name', ''))
     except Exception as e:
         st.error(f"Failed to load automations: {e}")
@@ -448,18 +667,7 @@ def delete_eventbridge_schedule(schedule_name):
 def get_color_presets_for_location(location):
     """Get all color config names that apply to a specific location."""
     try:
-        response = table_color.scan(
-            FilterExpression=Attr('locations').contains(location)
-        )
-        
-        items = response.get('Items', [])
-        
-        while 'LastEvaluatedKey' in response:
-            response = table_color.scan(
-                FilterExpression=Attr('locations').contains(location),
-                ExclusiveStartKey=response['LastEvaluatedKey']
-            )
-            items.extend(response.get('Items', []))
+        items = scan_items(table_color, FilterExpression=Attr('locations').contains(location))
         
         config_names = [item.get('color_config_name') for item in items if item.get('color_config_name')]
         return sorted(list(set(config_names)))
@@ -559,7 +767,8 @@ def check_password():
                         Item={
                             "username": user["username"],
                             "login_ts": finland_now.isoformat(),
-                            "login_date": finland_now.strftime("%Y-%m-%d")
+                            "login_date": finland_now.strftime("%Y-%m-%d"),
+                            "login_month": finland_now.strftime("%Y-%m")
                         }
                     )
                 except Exception as e:
@@ -756,53 +965,273 @@ def get_text_color_from_background(hex_color):
     return "#000000" if luminance > 0.5 else "#FFFFFF"
 
 
+NO_RANGES_COLOR = "rgb(150, 150, 150)"
+DEFAULT_TEXT_COLOR = "#000000"
+
+
+def _text_color_or_default(color) -> str:
+    """get_text_color_from_background, or DEFAULT_TEXT_COLOR for a colour that is not #rrggbb."""
+    try:
+        return get_text_color_from_background(color)
+    except (ValueError, TypeError, AttributeError):
+        return DEFAULT_TEXT_COLOR
+
+
+class ColorScale:
+    """
+    A colour preset compiled for lookups: ranges sorted by `min` once, with
+    their colours (and, when first asked for, matching text colours) in
+    arrays, so a whole Series is coloured with two searchsorted calls.
+
+    A value takes the colour of the first range (in `min` order) containing
+    it; values below every range take the first colour, and values in a gap,
+    above every range or NaN take the last.
+    """
+
+    def __init__(self, price_ranges: list):
+        ranges = sorted(price_ranges, key=lambda x: x['min'])
+        if ranges:
+            self.mins   = np.array([float(r['min']) for r in ranges])
+            # Running max of the upper bounds: the first range whose max
+            # reaches a value is found by one searchsorted over it
+            self.maxes  = np.maximum.accumulate([float(r['max']) for r in ranges])
+            self.colors = np.array([r['color'] for r in ranges], dtype=object)
+        else:
+            self.mins = self.maxes = np.array([np.inf])
+            self.colors = np.array([NO_RANGES_COLOR], dtype=object)
+
+    @cached_property
+    def text_colors(self) -> np.ndarray:
+        # Only the cell grids need text colours, so they are worked out on
+        # first use; a preset colour that is not hex (a name, rgb(...)) gets
+        # the default instead of failing the whole scale
+        if len(self.colors) == 1 and self.colors[0] == NO_RANGES_COLOR:
+            return np.array(["#FFFFFF"], dtype=object)
+        return np.array([_text_color_or_default(c) for c in self.colors], dtype=object)
+
+    def indices(self, values) -> np.ndarray:
+        values = np.asarray(values, dtype=float)
+        below  = np.searchsorted(self.mins, values, side='right')   # ranges with min <= value
+        first  = np.searchsorted(self.maxes, values, side='left')   # first range with max >= value
+        fallback = np.where(values < self.mins[0], 0, len(self.colors) - 1)
+        return np.where(first < below, first, fallback)
+
+    def map(self, values) -> pd.Series:
+        """Background colour per value, aligned with `values`."""
+        return pd.Series(self.colors[self.indices(values)], index=getattr(values, 'index', None))
+
+    def text_map(self, values) -> pd.Series:
+        """Readable text colour per value, aligned with `values`."""
+        return pd.Series(self.text_colors[self.indices(values)], index=getattr(values, 'index', None))
+
+    def color(self, value) -> str:
+        return self.colors[self.indices([value])[0]]
+
+
+@st.cache_resource(max_entries=32)
+def _compiled_color_scale(ranges_key: tuple) -> ColorScale:
+    return ColorScale([{'min': lo, 'max': hi, 'color': color} for lo, hi, color in ranges_key])
+
+
+def color_scale(price_ranges: list) -> ColorScale:
+    """The compiled ColorScale of a preset, built once per distinct list of ranges."""
+    return _compiled_color_scale(tuple((float(r['min']), float(r['max']), r['color'])
+                                       for r in price_ranges or []))
+
+
 def get_color_from_price_ranges(value, price_ranges):
     """Generate color based on price value and defined ranges."""
-    if not price_ranges:
-        return "rgb(150, 150, 150)"
-    
-    sorted_ranges = sorted(price_ranges, key=lambda x: x['min'])
-    
-    for range_item in sorted_ranges:
-        if range_item['min'] <= value <= range_item['max']:
-            return range_item['color']
-    
-    if value < sorted_ranges[0]['min']:
-        return sorted_ranges[0]['color']
-    else:
-        return sorted_ranges[-1]['color']
+    return color_scale(price_ranges).color(value)
 
 
 def make_x_label(price_date_series):
     """Generate stacked x-axis labels: DAY / DD / Mon, red for weekends"""
-    day_abbr = price_date_series.dt.strftime('%a').str.upper()
-    day_num = price_date_series.dt.strftime('%d').str.lstrip('0')
-    month_abbr = price_date_series.dt.strftime('%b')
-    dayofweek = price_date_series.dt.dayofweek
-    is_weekend = (dayofweek == 4) | (dayofweek == 5)
     weekend_color = "#ff6b6b"
-    labels = []
-    for i in range(len(price_date_series)):
-        if is_weekend.iloc[i]:
-            label = (
-                f'<b><span style="color:{weekend_color}">' + day_abbr.iloc[i] + '</span></b><br>' +
-                f'<b><span style="color:{weekend_color}">' + day_num.iloc[i] + '</span></b><br>' +
-                f'<b><span style="color:{weekend_color}">' + month_abbr.iloc[i] + '</span></b>'
-            )
-        else:
-            label = (
-                '<b>' + day_abbr.iloc[i] + '</b><br>' +
-                '<b>' + day_num.iloc[i] + '</b><br>' +
-                '<b>' + month_abbr.iloc[i] + '</b>'
-            )
-        labels.append(label)
+    is_weekend = price_date_series.dt.dayofweek.isin([4, 5])
+    open_tag  = pd.Series(np.where(is_weekend, f'<b><span style="color:{weekend_color}">', '<b>'),
+                          index=price_date_series.index)
+    close_tag = pd.Series(np.where(is_weekend, '</span></b>', '</b>'),
+                          index=price_date_series.index)
+
+    def part(text):
+        return open_tag + text + close_tag
 
-    return pd.Series(labels, index=price_date_series.index)
+    return (part(price_date_series.dt.strftime('%a').str.upper()) + '<br>' +
+            part(price_date_series.dt.strftime('%d').str.lstrip('0')) + '<br>' +
+            part(price_date_series.dt.strftime('%b')))
+
+
+def add_week_bands(fig, week_nums):
+    """
+    Add week label bands below the x-axis spanning each week's bars.
+    `week_nums` holds the week number of each bar in x order; every band
+    comes from one groupby over the bar positions and all shapes and
+    annotations are added in a single layout update.
+    """
+    spans = (pd.DataFrame({'week': np.asarray(week_nums), 'pos': np.arange(len(week_nums))})
+             .groupby('week', sort=True)['pos'].agg(['min', 'max']))
+    x_start = spans['min'].to_numpy() - 0.45
+    x_end   = spans['max'].to_numpy() + 0.45
+    bg_color = st.get_option("theme.backgroundColor") or "#0e1117"
+
+    shapes = [
+        dict(type="rect", xref="x", yref="paper", x0=x0, x1=x1, y0=-0.27, y1=-0.18,
+             fillcolor=bg_color, line=dict(color="white", width=2), layer="above")
+        for x0, x1 in zip(x_start, x_end)
+    ]
+    annotations = [
+        dict(x=(x0 + x1) / 2, y=-0.25, xref="x", yref="paper", text=f"<b>Week {week_num}</b>",
+             showarrow=False, font=dict(size=12, color="white"), align="center")
+        for week_num, x0, x1 in zip(spans.index, x_start, x_end)
+    ]
+    fig.update_layout(shapes=list(fig.layout.shapes) + shapes,
+                      annotations=list(fig.layout.annotations) + annotations)
+    return fig
 
     
-# ==================== QUERY FUNCTIONS ====================
-def query_hotels(filters, date_range, scraped_date_start, scraped_date_end):
-    """Query DynamoDB for hotel prices based on filters and date ranges."""
+# ==================== QUERY RESULT CACHE ====================
+# Shared by every session in the process. Entries for today's scrape date can
+# still receive new scrapes, so they expire quickly; past scrape dates are
+# immutable and are kept until evicted by the byte budget.
+
+QUERY_CACHE_MAX_BYTES  = 512 * 1024 * 1024
+QUERY_CACHE_TTL_OPEN   = 120          # seconds — scrape date is today (or later)
+QUERY_CACHE_TTL_CLOSED = 12 * 3600    # seconds — scrape date in the past
+
+
+def _estimate_nbytes(value) -> int:
+    """Approximate in-memory size of a cached result (DataFrame, list of row dicts or tuple of those)."""
+    if isinstance(value, tuple):
+        return sys.getsizeof(value) + sum(_estimate_nbytes(v) for v in value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, list) and value:
+        sample = value[:100]
+        per_row = sum(
+            sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+            for row in sample
+        ) / len(sample)
+        return int(per_row * len(value)) + sys.getsizeof(value)
+    return sys.getsizeof(value)
+
+
+class QueryResultCache:
+    """Thread-safe TTL cache with LRU eviction bounded by total estimated bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries  = OrderedDict()   # key -> (expires_at, nbytes, value)
+        self._bytes    = 0
+        self._lock     = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, value, ttl: float):
+        nbytes = _estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, nbytes, value)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries':   len(self._entries),
+                'bytes':     self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits':      self.hits,
+                'misses':    self.misses,
+                'evictions': self.evictions,
+                'hit_rate':  self.hits / total if total else 0.0,
+            }
+
+    def _drop(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+
+@st.cache_resource
+def _query_result_cache() -> QueryResultCache:
+    return QueryResultCache(QUERY_CACHE_MAX_BYTES)
+
+
+def _query_cache_ttl(scraped_date: str) -> float:
+    today = datetime.now(FINLAND_TZ).strftime("%Y-%m-%d")
+    return QUERY_CACHE_TTL_OPEN if scraped_date >= today else QUERY_CACHE_TTL_CLOSED
+
+
+# ==================== SCRAPE-DATE SEGMENTS ====================
+# query_hotels results are cached per (partition key, scraped_date) segment,
+# together with the check-in range the segment was fetched for. A request is
+# answered from the segments that already cover it; only the missing scrape
+# dates are read from DynamoDB, as contiguous `scraped_date` key prefixes.
+
+def _segment_covers(segment, checkin_start, checkin_end) -> bool:
+    """A None bound means the segment was fetched without that check-in limit."""
+    lo, hi, _ = segment
+    return ((lo is None or (checkin_start is not None and lo <= checkin_start)) and
+            (hi is None or (checkin_end is not None and hi >= checkin_end)))
+
+
+def _contiguous_runs(dates: list) -> list:
+    """Group sorted 'YYYY-MM-DD' strings into [(first, last, [dates...]), ...] of consecutive days."""
+    runs = []
+    for d in dates:
+        if runs and (datetime.strptime(d, "%Y-%m-%d") -
+                     datetime.strptime(runs[-1][1], "%Y-%m-%d")).days == 1:
+            runs[-1] = (runs[-1][0], d, runs[-1][2] + [d])
+        else:
+            runs.append((d, d, [d]))
+    return runs
+
+
+# ==================== ACCESS-PATH PLANNER ====================
+# matrix_pipeline.plan_price_query picks the base table or the check-in GSI
+# for each HotelPrices read; the plans run on the shared query pool.
+
+def _collect_price_plan(plan: dict, label: str) -> list:
+    """Run a plan to completion, log what it cost and return its raw items. Raises on errors."""
+    items    = []
+    capacity = 0.0
+    for _, page, units in _iter_pages(table.name, 'query', [(None, request) for request in plan['requests']]):
+        capacity += units
+        if page is not None:
+            items.extend(page)
+    matrix_pipeline.log_price_plan(label, plan, len(items), capacity)
+    return items
+
+
+def iter_query_hotels(filters, date_range, scraped_date_start, scraped_date_end):
+    """
+    Streaming form of query_hotels. Yields (chunk, done, total) as data
+    arrives: chunk is a typed frame already trimmed to the stay window and
+    done/total count finished fetch requests. Cached segments come first in
+    a single chunk; each DynamoDB page follows as its own chunk. Completed
+    scrape dates are written back to the segment cache. Raises on DynamoDB errors.
+    """
     location = filters.get('location')
     time = filters.get('time')
     persons = filters.get('persons')
@@ -820,95 +1249,159 @@ def query_hotels(filters, date_range, scraped_date_start, scraped_date_end):
         checkin_start = None
         checkin_end = None
 
+    def trim(frame):
+        if checkin_start and checkin_end:
+            return frame[(frame['price_date'] >= checkin_start) & (frame['price_date'] <= checkin_end)]
+        return frame
+
     partition_key = f"{location}#{persons}#{nights}#{time}"
-    
-    filter_expression = None
-    if checkin_start and checkin_end:
-        filter_expression = Attr('checkin_date').between(checkin_start, checkin_end)
-    
-    all_items = []
-    
+
+    cache    = _query_result_cache()
+    cached   = []
+    missing  = []
+    mirror_done = hotel_mirror.last_complete(HOTEL_MIRROR_DIR, location, persons, nights, time) or ""
+    for sdate in matrix_pipeline.scrape_dates(scraped_date_start, scraped_date_end):
+        seg = cache.get(('segment', partition_key, sdate))
+        if seg is not None and _segment_covers(seg, checkin_start, checkin_end):
+            cached.append(trim(seg[2]))
+        else:
+            missing.append((sdate, seg))
+
+    # Split at the mirror boundary so mirrored dates are read locally in one go.
+    runs = (_contiguous_runs([d for d, _ in missing if d <= mirror_done]) +
+            _contiguous_runs([d for d, _ in missing if d > mirror_done]))
+    mirrored_runs = []
+    run_state     = {}
+    jobs          = []
+    for idx, (first, last, run_dates) in enumerate(runs):
+        # Widen the fetch to the union with any stale coverage so the
+        # refreshed segments still answer the previous window too.
+        lo, hi = checkin_start, checkin_end
+        for d, old in missing:
+            if old is not None and first <= d <= last and lo is not None:
+                lo = None if old[0] is None else min(lo, old[0])
+                hi = None if old[1] is None or hi is None else max(hi, old[1])
+        state = {'dates': run_dates, 'lo': lo, 'hi': hi, 'pages': [], 'capacity': 0.0}
+        mirrored = _price_store().mirror_items(location, persons, nights, time, first, last, lo, hi)
+        if mirrored is not None:
+            mirrored_runs.append((state, matrix_pipeline.items_to_frame(mirrored)))
+            continue
+        state['plan']    = matrix_pipeline.plan_price_query(partition_key, first, last, lo, hi)
+        state['pending'] = len(state['plan']['requests'])
+        run_state[idx]   = state
+        jobs.extend((idx, request) for request in state['plan']['requests'])
+
+    def store(state, frame):
+        by_date = {d: frame.iloc[0:0] for d in state['dates']}
+        by_date.update(dict(list(frame.groupby(frame['scrape_date'].dt.strftime('%Y-%m-%d')))))
+        for sdate, part in by_date.items():
+            cache.put(('segment', partition_key, sdate),
+                      (state['lo'], state['hi'], part.reset_index(drop=True)),
+                      _query_cache_ttl(sdate))
+
+    total = len(jobs) + len(mirrored_runs)
+    done  = 0
+    if cached:
+        yield matrix_pipeline.concat_price_frames(cached), done, total
+
+    for state, frame in mirrored_runs:
+        store(state, frame)
+        done += 1
+        yield trim(frame), done, total
+
+    for idx, page, units in _iter_pages(table.name, 'query', jobs):
+        state = run_state[idx]
+        state['capacity'] += units
+        if page is not None:
+            frame = matrix_pipeline.items_to_frame(page)
+            state['pages'].append(frame)
+            yield trim(frame), done, total
+            continue
+
+        done += 1
+        state['pending'] -= 1
+        if state['pending'] == 0:
+            frame = matrix_pipeline.concat_price_frames(state['pages'])
+            matrix_pipeline.log_price_plan(
+                f"query_hotels {partition_key} {state['dates'][0]}..{state['dates'][-1]}",
+                state['plan'], len(frame), state['capacity'])
+            store(state, frame)
+            state['pages'] = []
+        yield matrix_pipeline.items_to_frame([]), done, total
+
+
+def query_hotels(filters, date_range, scraped_date_start, scraped_date_end):
+    """
+    Query DynamoDB for hotel prices based on filters and date ranges.
+    Scrape dates already held in the process-wide segment cache are reused;
+    only the missing ones are fetched and then merged in scrape-date order.
+    Returns a typed frame (see matrix_pipeline.items_to_frame); empty when nothing matched.
+    """
     try:
-        key_condition = (
-            Key('location#persons#nights#time').eq(partition_key) &
-            Key('scraped_date#hotel_id#checkin_date#checkout_date')
-                .between(f"{scraped_date_start}#", f"{scraped_date_end}~")
-        )
-        
-        response = table.query(
-            KeyConditionExpression=key_condition,
-            FilterExpression=filter_expression
-        )
-        
-        items = response['Items']
-        
-        while 'LastEvaluatedKey' in response:
-            response = table.query(
-                KeyConditionExpression=key_condition,
-                FilterExpression=filter_expression,
-                ExclusiveStartKey=response['LastEvaluatedKey']
-            )
-            items.extend(response['Items'])
-        
-        all_items.extend(items)
-        
-        transformed_items = []
-        for item in all_items:
-            transformed_items.append({
-                'name': item.get('hotel_name', ''),
-                'price': item.get('price', 0),
-                'price_date': item.get('checkin_date', ''),
-                'scrape_date': item.get('scraped_date', ''),
-                'location': item.get('location', ''),
-                'persons': item.get('persons', 0),
-                'nights': item.get('nights', 0),
-                'time': item.get('time', ''),
-                'review_score': item.get('review_score', 0),
-                'city': item.get('city', ''),
-                'distance': item.get('distance', ''),
-                'hotel_url': item.get('hotel_url', ''),
-                'breakfast_included': item.get('breakfast_included', False),
-                'free_cancellation': item.get('free_cancellation', False)
-            })
-        
-        return transformed_items
+        chunks = [chunk for chunk, _, _ in
+                  iter_query_hotels(filters, date_range, scraped_date_start, scraped_date_end)]
+        return (matrix_pipeline.concat_price_frames(chunks)
+                .sort_values('scrape_date', kind='stable', ignore_index=True))
     
     except Exception as e:
         st.error(f"Error querying DynamoDB: {str(e)}")
-        return []
+        return matrix_pipeline.items_to_frame([])
 
-# def query_calendar_data(price_start_date, price_end_date, zone_filter="zone1", location="tampere"):
-#     """Query data for calendar heatmap."""
-#     price_dates = []
-#     d = price_start_date
-#     while d <= price_end_date:
-#         price_dates.append(d.strftime("%Y-%m-%d"))
-#         d += timedelta(days=1)
-    
-#     metrics = {
-#         'availability': {},
-#         'price_avg': {},
-#         'free_cancel_avg': {}
-#     }
-
-#     for idx, pdate in enumerate(price_dates, 1):
-#         partition_key = f"{location}#{zone_filter}#{pdate}"
-#         try:
-#             response = table_calender.get_item(
-#                 Key={'location#zone#checkin_date': partition_key}
-#             )
-#             item = response.get('Item')
-#             if item:
-#                 metrics["availability"][pdate] = item.get("availability")
-#                 metrics["free_cancel_avg"][pdate] = item.get("free_cancel_avg")
-#                 metrics["price_avg"][pdate] = item.get("price_avg")
-#         except Exception as e:
-#             st.error(f"Error querying DynamoDB: {str(e)}")
-#             return metrics
-
-#     return metrics
-
-def query_calendar_hotels(date_range, scraped_date_start, scraped_date_end):
+
+# Minimum seconds between partial chart redraws while a query streams in
+PREVIEW_REDRAW_SECONDS = 0.5
+
+
+def query_hotels_progressive(filters, date_range, scraped_date_start, scraped_date_end):
+    """
+    query_hotels for the Price Dashboard: shows a progress bar and a partial
+    average-price bar chart (all hotels) while pages stream in, then clears
+    both and returns the full typed frame.
+    """
+    progress   = st.progress(0.0, text="🔍 Searching hotels...")
+    chart_slot = st.empty()
+    chunks     = []
+    sums       = pd.Series(dtype='float64')
+    counts     = pd.Series(dtype='float64')
+    last_draw  = 0.0
+
+    try:
+        for chunk, done, total in iter_query_hotels(filters, date_range,
+                                                    scraped_date_start, scraped_date_end):
+            if not chunk.empty:
+                chunks.append(chunk)
+                by_date = chunk.dropna(subset=['price']).groupby('price_date')['price']
+                sums    = sums.add(by_date.sum().astype('float64'), fill_value=0)
+                counts  = counts.add(by_date.count().astype('float64'), fill_value=0)
+
+            n_rows = sum(len(c) for c in chunks)
+            progress.progress(done / total if total else 1.0,
+                              text=f"🔍 Searching hotels... {n_rows:,} records ({done}/{total} requests)")
+
+            now = time.perf_counter()
+            if not counts.empty and now - last_draw >= PREVIEW_REDRAW_SECONDS:
+                avg = (sums / counts).round(2).sort_index()
+                fig = px.bar(x=avg.index, y=avg.values,
+                             labels={'x': 'Date', 'y': 'Average Price (€)'},
+                             title=f'Average Prices, all hotels — loading ({n_rows:,} records)')
+                fig.update_layout(height=400)
+                chart_slot.plotly_chart(fig, use_container_width=True)
+                last_draw = now
+
+        results = (matrix_pipeline.concat_price_frames(chunks)
+                   .sort_values('scrape_date', kind='stable', ignore_index=True))
+
+    except Exception as e:
+        st.error(f"Error querying DynamoDB: {str(e)}")
+        results = matrix_pipeline.items_to_frame([])
+
+    progress.empty()
+    chart_slot.empty()
+    return results
+
+
+def query_calendar_hotels(date_range, scraped_date_start, scraped_date_end, tbl=None, raise_errors=False):
+    tbl = tbl if tbl is not None else table
     location = "tampere"
     time = "morning"
     persons = 2
@@ -919,10 +1412,16 @@ def query_calendar_hotels(date_range, scraped_date_start, scraped_date_end):
         day, month, year = dates[0].split('-')
         checkin_date = f"{year}-{month}-{day}"
     else:
-        return []
+        return matrix_pipeline.items_to_frame([])
 
     partition_key = f"{location}#{persons}#{nights}#{time}"
 
+    mirrored = _price_store().mirror_items(location, persons, nights, time,
+                                           scraped_date_start, scraped_date_end,
+                                           checkin_date, checkin_date)
+    if mirrored is not None:
+        return matrix_pipeline.items_to_frame(mirrored)
+
     all_items = []
 
     try:
@@ -934,7 +1433,7 @@ def query_calendar_hotels(date_range, scraped_date_start, scraped_date_end):
             )
         )
 
-        response = table.query(
+        response = tbl.query(
             IndexName='hotel_prices_by_checkin_scraped',
             KeyConditionExpression=key_condition
         )
@@ -942,7 +1441,7 @@ def query_calendar_hotels(date_range, scraped_date_start, scraped_date_end):
         items = response['Items']
 
         while 'LastEvaluatedKey' in response:
-            response = table.query(
+            response = tbl.query(
                 IndexName='hotel_prices_by_checkin_scraped',
                 KeyConditionExpression=key_condition,
                 ExclusiveStartKey=response['LastEvaluatedKey']
@@ -951,361 +1450,641 @@ def query_calendar_hotels(date_range, scraped_date_start, scraped_date_end):
 
         all_items.extend(items)
 
-        transformed_items = []
-        for item in all_items:
-            transformed_items.append({
-                'name': item.get('hotel_name', ''),
-                'price': item.get('price', 0),
-                'price_date': item.get('checkin_date', ''),
-                'scrape_date': item.get('scraped_date', ''),
-                'location': item.get('location', ''),
-                'persons': item.get('persons', 0),
-                'nights': item.get('nights', 0),
-                'time': item.get('time', ''),
-                'review_score': item.get('review_score', 0),
-                'city': item.get('city', ''),
-                'distance': item.get('distance', ''),
-                'hotel_url': item.get('hotel_url', ''),
-                'breakfast_included': item.get('breakfast_included', False),
-                'free_cancellation': item.get('free_cancellation', False)
-            })
-
-        return transformed_items
+        return matrix_pipeline.items_to_frame(all_items)
 
     except Exception:
-        return []
+        if raise_errors:
+            raise
+        return matrix_pipeline.items_to_frame([])
 
-def query_calendar_data(price_start_date, price_end_date, zone_filter="zone1", location="tampere"):
-    """Query data for calendar heatmap."""
-    price_dates = []
-    d = price_start_date
-    while d <= price_end_date:
-        price_dates.append(d.strftime("%Y-%m-%d"))  # YYYY-MM-DD (DB format)
-        d += timedelta(days=1)
-    
+
+def query_calendar_range(checkin_start, checkin_end, scraped_date_start, scraped_date_end, tbl=None,
+                         raise_errors=False):
+    """
+    Fetch a contiguous run of check-in dates with a single GSI key range:
+    '<checkin_start>#<scraped_date_start>' → '<checkin_end>#<scraped_date_end>~'.
+    Dates between the two ends come back with every scrape, so callers must
+    trim rows to their own scrape window; the FilterExpression only drops
+    rows outside the overall scrape span to keep the transfer small.
+    Query errors come back as an empty frame unless `raise_errors` is set.
+    """
+    tbl = tbl if tbl is not None else table
+    location = "tampere"
     time = "morning"
     persons = 2
     nights = 1
+
     partition_key = f"{location}#{persons}#{nights}#{time}"
-    
+
+    mirrored = _price_store().mirror_items(location, persons, nights, time,
+                                           scraped_date_start, scraped_date_end,
+                                           checkin_start, checkin_end)
+    if mirrored is not None:
+        return matrix_pipeline.items_to_frame(mirrored)
+
+    try:
+        key_condition = (
+            Key('location#persons#nights#time').eq(partition_key) &
+            Key('checkin_date#scraped_date').between(
+                f"{checkin_start}#{scraped_date_start}",
+                f"{checkin_end}#{scraped_date_end}~"
+            )
+        )
+        filter_expression = Attr('scraped_date').between(scraped_date_start, scraped_date_end)
+
+        response = tbl.query(
+            IndexName='hotel_prices_by_checkin_scraped',
+            KeyConditionExpression=key_condition,
+            FilterExpression=filter_expression
+        )
+
+        items = response['Items']
+
+        while 'LastEvaluatedKey' in response:
+            response = tbl.query(
+                IndexName='hotel_prices_by_checkin_scraped',
+                KeyConditionExpression=key_condition,
+                FilterExpression=filter_expression,
+                ExclusiveStartKey=response['LastEvaluatedKey']
+            )
+            items.extend(response['Items'])
+
+        return matrix_pipeline.items_to_frame(items)
+
+    except Exception:
+        if raise_errors:
+            raise
+        return matrix_pipeline.items_to_frame([])
+
+
+CALENDAR_SCRAPE_WINDOW_DAYS = 30
+
+# The calendar queries read the tampere 2-person / 1-night / morning partition
+# and know only these zones; the aggregate store holds rows for nothing else.
+CALENDAR_LOCATIONS = ["tampere"]
+CALENDAR_ZONES = {
+    'zone1': ZONE1_HOTELS,
+    'zone2': ZONE2_HOTELS,
+    'zone3': ZONE3_HOTELS,
+    'alert': Alert_Comparison
+}
+
+
+def _plan_calendar_ranges(price_start_date, price_end_date) -> list:
+    """
+    Plan every per-date GSI key range up front.
+    Returns [(checkin 'YYYY-MM-DD', scraped_start, scraped_end), ...] — the scrape
+    window for a check-in date is the 30 days leading up to (and including) it.
+    """
+    plan = []
+    d = price_start_date
+    while d <= price_end_date:
+        pdate = d.strftime("%Y-%m-%d")  # YYYY-MM-DD (DB format)
+        price_dt = datetime.strptime(pdate, "%Y-%m-%d")
+        scraped_start = (price_dt - timedelta(days=CALENDAR_SCRAPE_WINDOW_DAYS)).strftime("%Y-%m-%d")
+        plan.append((pdate, scraped_start, pdate))
+        d += timedelta(days=1)
+    return plan
+
+
+def _fetch_calendar_window(pdate, scraped_start, scraped_end, raise_errors=False):
+    """Pool task: fetch one check-in date's scrape window on the worker's own Table handle."""
+    price_ddmmyyyy = datetime.strptime(pdate, "%Y-%m-%d").strftime("%d-%m-%Y")
+    return query_calendar_hotels(
+        date_range=f"{price_ddmmyyyy} - {price_ddmmyyyy}",
+        scraped_date_start=scraped_start,
+        scraped_date_end=scraped_end,
+        tbl=_thread_table(table.name),
+        raise_errors=raise_errors
+    )
+
+
+def _fetch_calendar_chunk(checkin_start, checkin_end, scraped_start, scraped_end, raise_errors=False):
+    """Pool task: fetch one contiguous run of check-in dates on the worker's own Table handle."""
+    return query_calendar_range(checkin_start, checkin_end, scraped_start, scraped_end,
+                                tbl=_thread_table(table.name), raise_errors=raise_errors)
+
+
+def _plan_calendar_chunks(plan: list, n_chunks: int) -> list:
+    """
+    Split the per-date plan into at most `n_chunks` contiguous check-in runs.
+    Each run becomes one GSI key range from its first date's window start to
+    its last date's same-day scrape.
+    """
+    size = max(1, -(-len(plan) // max(1, n_chunks)))
+    chunks = []
+    for i in range(0, len(plan), size):
+        run = plan[i:i + size]
+        chunks.append((run[0][0], run[-1][0], run[0][1], run[-1][2]))
+    return chunks
+
+
+def _aggregate_calendar_metrics(df: pd.DataFrame, plan: list, selected_zone: list,
+                                fill_empty: bool = True) -> dict:
+    """
+    Compute every date's metrics in one grouped pass over all fetched rows.
+    Rows outside a date's own 30-day scrape window are dropped first, so the
+    input may be either per-date windows or one wide range fetch. Dates with
+    no rows report 0, or are left out when `fill_empty` is False.
+    """
     metrics = {
         'availability': {},
         'price_avg': {},
         'free_cancel_avg': {}
     }
-    
-    zone_mapping = {
-        'zone1': ZONE1_HOTELS,
-        'zone2': ZONE2_HOTELS,
-        'zone3': ZONE3_HOTELS,
-        'alert': Alert_Comparison
-    }
-    
-    selected_zone = zone_mapping.get(zone_filter, ZONE1_HOTELS)
-    
-    for idx, pdate in enumerate(price_dates, 1):
-        # For this price date, scrape window is 30 days before it
-        price_dt = datetime.strptime(pdate, "%Y-%m-%d")
-        scrape_start_dt = price_dt - timedelta(days=30)
-        
-        scraped_start = scrape_start_dt.strftime("%Y-%m-%d")
-        scraped_end = pdate
 
-        price_ddmmyyyy = price_dt.strftime("%d-%m-%Y")
-        date_range_for_query = f"{price_ddmmyyyy} - {price_ddmmyyyy}"
+    window_start = pd.Series({pd.Timestamp(pdate): pd.Timestamp(scraped_start)
+                              for pdate, scraped_start, _ in plan}, dtype='datetime64[ns]')
+    df = df[
+        (df['scrape_date'] >= df['price_date'].map(window_start)) &
+        (df['scrape_date'] <= df['price_date'])
+    ]
+    df = df.assign(price_date=df['price_date'].dt.strftime('%Y-%m-%d'))
+    dates_with_rows = set(df['price_date'].unique())
 
+    df = df.dropna(subset=['price'])
+    zone_df = df[(df['breakfast_included'] == False) & df['name'].isin(selected_zone)]
 
-        results = query_calendar_hotels(
-            date_range=date_range_for_query,
-            scraped_date_start=scraped_start,
-            scraped_date_end=scraped_end
-        )
+    wo_avg = zone_df[zone_df['free_cancellation'] == False].groupby('price_date')['price'].mean().round(2)
+    fc_avg = zone_df[zone_df['free_cancellation'] == True].groupby('price_date')['price'].mean().round(2)
+    available = (zone_df[zone_df['scrape_date'] == pd.to_datetime(zone_df['price_date'])]
+                 .groupby('price_date')['name'].nunique())
 
-        # Query for price averages (30-day scrape window)
-        if not results:
+    total_zone = len(selected_zone)
+    for pdate, _, _ in plan:
+        if pdate not in dates_with_rows:
+            if not fill_empty:
+                continue
             metrics['free_cancel_avg'][pdate] = 0
             metrics['price_avg'][pdate] = 0
             metrics['availability'][pdate] = 0
             continue
 
-        df = pd.DataFrame(results)
-        df['price'] = pd.to_numeric(df['price'], errors='coerce')
-        df = df.dropna(subset=['price'])
-        fc_df = df.copy()
-        wo_df = df[(df['breakfast_included'] == False) & (df['free_cancellation'] == False)]
+        num_zone_available = int(available.get(pdate, 0))
+        metrics['free_cancel_avg'][pdate] = fc_avg.get(pdate, 0)
+        metrics['price_avg'][pdate] = wo_avg.get(pdate, 0)
+        metrics['availability'][pdate] = round((num_zone_available / total_zone) * 100, 1) if total_zone > 0 else 0
 
-        fc_df = df[(df['breakfast_included'] == False) & (df['free_cancellation'] == True)]
+    return metrics
 
-        wo_unique_hotels = sorted(wo_df['name'].unique())
-        fc_unique_hotels = sorted(fc_df['name'].unique())
 
-        wo_available_zone1 = [hotel for hotel in selected_zone if hotel in wo_unique_hotels]
-        fc_available_zone1 = [hotel for hotel in selected_zone if hotel in fc_unique_hotels]
+def query_calendar_data(price_start_date, price_end_date, zone_filter="zone1", location="tampere",
+                        timings=None, fetch_mode="per_date", use_store=True, strict=False):
+    """
+    Query data for calendar heatmap.
+    Dates whose scrape window has closed are read from the HotelPricesCalendar
+    store first; only the rest are computed live. fetch_mode="per_date" issues
+    one GSI query per check-in date; "range" reads the period as a few
+    contiguous key ranges (fewer round trips, more out-of-window rows read —
+    better for long periods). Both run on the shared query pool and feed the
+    same vectorized aggregation. Pass a dict as `timings` to receive per-phase
+    durations. With `strict`, query errors propagate and dates that returned
+    no rows are left out instead of being reported as 0.
+    """
+    t0 = time.perf_counter()
 
-        wo_df_zone1 = wo_df[wo_df['name'].isin(wo_available_zone1)]
-        fc_df_zone1 = fc_df[fc_df['name'].isin(fc_available_zone1)]
+    selected_zone = CALENDAR_ZONES.get(zone_filter, ZONE1_HOTELS)
 
-        wo_avg = round(wo_df_zone1['price'].mean(),2) if not wo_df_zone1.empty else 0
-        fc_avg = round(fc_df_zone1['price'].mean(),2) if not fc_df_zone1.empty else 0
+    plan = _plan_calendar_ranges(price_start_date, price_end_date)
+    t_plan = time.perf_counter()
 
-        total_records = len(df)
-        price_ddmmyyyy_avail = price_dt.strftime("%d-%m-%Y")
-        date_range_for_avail = f"{price_ddmmyyyy_avail} - {price_ddmmyyyy_avail}"
-        
-        results_avail = query_calendar_hotels(
-            date_range=date_range_for_avail,
-            scraped_date_start=pdate,
-            scraped_date_end=pdate
-        )
-        
-        if results_avail:
-            df_avail = pd.DataFrame(results_avail)
-            df_avail['price'] = pd.to_numeric(df_avail['price'], errors='coerce')
-            df_avail = df_avail.dropna(subset=['price'])
-            df_avail = df_avail[(df_avail['breakfast_included'] == False)]
-            unique_hotels_avail = sorted(df_avail['name'].unique())
-            available_zone1 = [hotel for hotel in selected_zone if hotel in unique_hotels_avail]
-        else:
-            available_zone1 = []
-        
-        num_zone1_available = len(available_zone1)
+    stored = {}
+    if use_store and location in CALENDAR_LOCATIONS and zone_filter in CALENDAR_ZONES:
+        closed = [pdate for pdate, _, _ in plan if _calendar_window_closed(pdate)]
+        stored = _load_calendar_aggregates(location, zone_filter, closed)
+    live_plan = [rng for rng in plan if rng[0] not in stored]
+    t_store = time.perf_counter()
 
-        TOTAL_ZONE1 = len(selected_zone)
-        zone1_avail_pct = round((num_zone1_available / TOTAL_ZONE1) * 100, 1) if TOTAL_ZONE1 > 0 else 0
+    if not live_plan:
+        tasks = []
+    elif fetch_mode == "range":
+        tasks = [(_fetch_calendar_chunk, chunk)
+                 for chunk in _plan_calendar_chunks(live_plan, matrix_pipeline.QUERY_POOL_WORKERS)]
+    else:
+        tasks = [(_fetch_calendar_window, rng) for rng in live_plan]
+
+    futures = [_query_pool().submit(fn, *args, raise_errors=strict) for fn, args in tasks]
+    rows = matrix_pipeline.concat_price_frames([f.result() for f in futures])
+    t_fetch = time.perf_counter()
+
+    live = _aggregate_calendar_metrics(rows, live_plan, selected_zone, fill_empty=not strict)
+    metrics = {metric: {} for metric in live}
+    for pdate, _, _ in plan:
+        if pdate in stored:
+            source = stored[pdate]
+        elif pdate in live['price_avg']:
+            source = {m: live[m][pdate] for m in live}
+        else:
+            continue
+        for metric in metrics:
+            metrics[metric][pdate] = source[metric]
+    t_agg = time.perf_counter()
+
+    if timings is not None:
+        timings.update({
+            'dates':     len(plan),
+            'stored':    len(stored),
+            'queries':   len(tasks),
+            'items':     len(rows),
+            'plan':      t_plan - t0,
+            'store':     t_store - t_plan,
+            'fetch':     t_fetch - t_store,
+            'aggregate': t_agg - t_fetch,
+        })
 
-        metrics['free_cancel_avg'][pdate] = fc_avg
-        metrics['price_avg'][pdate] = wo_avg
-        metrics['availability'][pdate] = zone1_avail_pct
-    
     return metrics
 
-def _query_matrix_data(location: str, persons: int, time_val: str,
-                        start_date, days_forward: int) -> list:
-    """
-    Query HotelPrices for a single persons/time combo.
-    - scrape_date = start_date (same day the user picks)
-    - checkin window = start_date → start_date + days_forward - 1
-    - nights = 1
-    - No breakfast/cancellation filter — returns all rows
-    """
-    scraped_date_str = start_date.strftime("%Y-%m-%d")
 
-    end_date      = start_date + timedelta(days=days_forward - 1)
-    checkin_start = start_date.strftime("%Y-%m-%d")
-    checkin_end   = end_date.strftime("%Y-%m-%d")
+# ==================== CALENDAR AGGREGATE STORE ====================
+# HotelPricesCalendar holds finished per-date metrics keyed by
+# 'location#zone#checkin_date'. A date is final once its scrape window has
+# closed, i.e. the check-in date itself is in the past (Finland time).
 
-    pk = f"{location}#{persons}#1#{time_val}"
+CALENDAR_BATCH_GET_LIMIT = 100
 
-    key_cond    = (
-        Key("location#persons#nights#time").eq(pk) &
-        Key("scraped_date#hotel_id#checkin_date#checkout_date")
-            .between(f"{scraped_date_str}#", f"{scraped_date_str}~")
-    )
-    filter_expr = Attr("checkin_date").between(checkin_start, checkin_end)
 
-    items = []
-    try:
-        resp = table.query(KeyConditionExpression=key_cond,
-                           FilterExpression=filter_expr)
-        items.extend(resp["Items"])
-        while "LastEvaluatedKey" in resp:
-            resp = table.query(
-                KeyConditionExpression=key_cond,
-                FilterExpression=filter_expr,
-                ExclusiveStartKey=resp["LastEvaluatedKey"]
-            )
-            items.extend(resp["Items"])
-    except Exception as e:
-        st.error(f"DynamoDB query error: {e}")
-
-    return [
-        {
-            "name":               item.get("hotel_name", ""),
-            "price":              item.get("price", 0),
-            "checkin_date":       item.get("checkin_date", ""),
-            "hotel_url":          item.get("hotel_url", ""),
-            "review_score":       item.get("review_score", ""),
-            "city":               item.get("city", ""),
-            "distance":           item.get("distance", ""),
-            "breakfast_included": item.get("breakfast_included", False),
-            "free_cancellation":  item.get("free_cancellation", False),
-            "persons":            persons,
-        }
-        for item in items
-    ]
- 
-def _build_excel_matrix(df: pd.DataFrame, zone_name: str, location: str,
-                         persons_list: list, single_sheet: str = None) -> bytes:
-    wb = openpyxl.Workbook()
-    wb.remove(wb.active)
-
-    hdr_font   = Font(bold=True, color="000000", name="Arial", size=9)
-    hotel_font = Font(bold=True, name="Arial", size=9)
-    data_font  = Font(name="Arial", size=9)
-    url_font   = Font(name="Arial", size=9, color="0563C1", underline="single")
-
-    center = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    left   = Alignment(horizontal="left", vertical="center")
-
-    thin = Side(style="thin", color="CCCCCC")
-    brd  = Border(left=thin, right=thin, top=thin, bottom=thin)
-
-    META_COLS = ["URL", "Name", "Review Score", "City", "Distance",
-                 "Breakfast Included", "Free Cancellation"]
-    n_meta = len(META_COLS)
-
-    df = df.copy()
-    df["row_id"] = (
-        df["name"].astype(str) + " | " +
-        df["breakfast_included"].astype(str) + " | " +
-        df["free_cancellation"].astype(str)
-    )
+def _calendar_store_key(location: str, zone_filter: str, pdate: str) -> str:
+    return f"{location}#{zone_filter}#{pdate}"
 
-    all_dates  = sorted(df["checkin_date"].unique())
-    col_labels = [datetime.strptime(d, "%Y-%m-%d").strftime("%d/%m/%Y")
-                  for d in all_dates]
-    all_headers = META_COLS + col_labels
-    n_total     = len(all_headers)
-
-    FILTERS = [
-        ("No Extras",          False, False),
-        ("Free Cancellation",  False, True),
-        ("Breakfast Included", True,  False),
-        ("Breakfast + Cancel", True,  True),
-    ]
 
-    def _write_sheet(ws, filtered_df):
-        for ci, label in enumerate(all_headers, start=1):
-            cell = ws.cell(row=1, column=ci, value=label)
-            cell.font      = hdr_font
-            cell.alignment = center
-            cell.border    = brd
-        ws.row_dimensions[1].height = 28
-
-        for ci, w in enumerate([45, 38, 12, 14, 22, 18, 18], start=1):
-            ws.column_dimensions[get_column_letter(ci)].width = w
-        for ci in range(n_meta + 1, n_total + 1):
-            ws.column_dimensions[get_column_letter(ci)].width = 12
-
-        if filtered_df.empty:
-            ws.cell(row=2, column=1, value="No data for this filter combination.").font = data_font
-            return
+def _calendar_window_closed(pdate: str) -> bool:
+    return pdate < datetime.now(FINLAND_TZ).strftime("%Y-%m-%d")
 
-        current_row = 2
-        for persons in sorted(persons_list):
-            p_df = filtered_df[filtered_df["persons"] == persons].copy()
-            if p_df.empty:
-                continue
 
-            ordered = sorted(p_df["row_id"].unique())
-            meta_lookup = (
-                p_df.drop_duplicates(subset=["row_id"])
-                    .set_index("row_id")[["hotel_url", "review_score", "city",
-                                          "distance", "breakfast_included",
-                                          "free_cancellation"]]
-                    .to_dict("index")
-            )
-            pivot = p_df.pivot_table(
-                index="row_id", columns="checkin_date",
-                values="price", aggfunc="first"
-            )
+def _load_calendar_aggregates(location: str, zone_filter: str, pdates: list) -> dict:
+    """
+    BatchGetItem the stored metrics for `pdates`.
+    Returns {pdate: {'availability', 'price_avg', 'free_cancel_avg'}} for the
+    rows that exist; missing dates are simply absent so the caller computes them.
+    """
+    found = {}
+    by_key = {_calendar_store_key(location, zone_filter, p): p for p in pdates}
+    keys = [{'location#zone#checkin_date': k} for k in by_key]
 
-            for row_id in ordered:
-                meta  = meta_lookup.get(row_id, {})
-                hotel = row_id.split(" | ")[0]
+    try:
+        for i in range(0, len(keys), CALENDAR_BATCH_GET_LIMIT):
+            request = {table_calender.name: {'Keys': keys[i:i + CALENDAR_BATCH_GET_LIMIT]}}
+            attempt = 0
+            while request:
+                response = dynamodb.batch_get_item(RequestItems=request)
+                for item in response.get('Responses', {}).get(table_calender.name, []):
+                    pdate = by_key.get(item['location#zone#checkin_date'])
+                    if pdate is not None:
+                        found[pdate] = {
+                            'availability':    float(item.get('availability', 0)),
+                            'price_avg':       float(item.get('price_avg', 0)),
+                            'free_cancel_avg': float(item.get('free_cancel_avg', 0)),
+                        }
+                request = response.get('UnprocessedKeys') or None
+                if request:
+                    attempt += 1
+                    time.sleep(min(0.05 * 2 ** attempt, 1.0))
+    except Exception as e:
+        st.warning(f"Calendar store unavailable, computing live: {e}")
+        return {}
 
-                url = meta.get("hotel_url", "")
-                uc  = ws.cell(row=current_row, column=1, value=url)
-                if url:
-                    uc.hyperlink = url
-                    uc.font = url_font
-                else:
-                    uc.font = data_font
-                uc.alignment = left
-                uc.border    = brd
+    return found
 
-                nc = ws.cell(row=current_row, column=2, value=hotel)
-                nc.font = hotel_font; nc.alignment = left; nc.border = brd
 
-                rv = meta.get("review_score", "")
-                rc = ws.cell(row=current_row, column=3, value=float(rv) if rv else "")
-                rc.font = data_font; rc.alignment = center; rc.border = brd
+def materialize_calendar_aggregates(price_start_date, price_end_date,
+                                    zone_filter: str, location: str,
+                                    fetch_mode: str = "range") -> int:
+    """
+    Compute and store the final metrics for every date in the range whose
+    scrape window has closed. Open dates are skipped — they are still changing.
+    A failed query aborts the run and dates that returned no rows are not
+    written, so neither is frozen as zeros. Returns the number of rows written.
+    Raises ValueError outside CALENDAR_LOCATIONS / CALENDAR_ZONES, whose
+    metrics the calendar queries cannot compute.
+    """
+    if location not in CALENDAR_LOCATIONS or zone_filter not in CALENDAR_ZONES:
+        raise ValueError(f"Calendar aggregates exist only for {', '.join(CALENDAR_LOCATIONS)} "
+                         f"zones {', '.join(CALENDAR_ZONES)}, not {location} / {zone_filter}")
+    last_closed = datetime.now(FINLAND_TZ).date() - timedelta(days=1)
+    end = min(price_end_date, last_closed)
+    if price_start_date > end:
+        return 0
+
+    metrics = query_calendar_data(price_start_date, end, zone_filter=zone_filter,
+                                  location=location, fetch_mode=fetch_mode,
+                                  use_store=False, strict=True)
+
+    materialized_at = datetime.now(FINLAND_TZ).isoformat()
+    written = 0
+    with table_calender.batch_writer(overwrite_by_pkeys=['location#zone#checkin_date']) as batch:
+        for pdate in metrics['price_avg']:
+            batch.put_item(Item={
+                'location#zone#checkin_date': _calendar_store_key(location, zone_filter, pdate),
+                'location':        location,
+                'zone':            zone_filter,
+                'checkin_date':    pdate,
+                'availability':    Decimal(str(float(metrics['availability'][pdate]))),
+                'price_avg':       Decimal(str(float(metrics['price_avg'][pdate]))),
+                'free_cancel_avg': Decimal(str(float(metrics['free_cancel_avg'][pdate]))),
+                'materialized_at': materialized_at,
+            })
+            written += 1
+    return written
 
-                cc = ws.cell(row=current_row, column=4, value=meta.get("city", ""))
-                cc.font = data_font; cc.alignment = left; cc.border = brd
 
-                dc = ws.cell(row=current_row, column=5, value=meta.get("distance", ""))
-                dc.font = data_font; dc.alignment = left; dc.border = brd
+@st.cache_resource
+def _matrix_artifact_cache():
+    """Process-wide matrix file cache, or None when MATRIX_CACHE_DIR is empty."""
+    if not MATRIX_CACHE_DIR:
+        return None
+    return matrix_cache.MatrixArtifactCache(MATRIX_CACHE_DIR, matrix_pipeline.MATRIX_CACHE_MAX_BYTES)
 
-                bc = ws.cell(row=current_row, column=6,
-                             value=str(meta.get("breakfast_included", False)))
-                bc.font = data_font; bc.alignment = center; bc.border = brd
 
-                fc = ws.cell(row=current_row, column=7,
-                             value=str(meta.get("free_cancellation", False)))
-                fc.font = data_font; fc.alignment = center; fc.border = brd
+def _export_format_label(fmt: str) -> str:
+    label, ext, _ = matrix_excel.EXPORT_FORMATS[fmt]
+    return f"{label} (.{ext})"
 
-                for col_offset, date_str in enumerate(all_dates):
-                    col_num = n_meta + col_offset + 1
-                    try:
-                        val = pivot.loc[row_id, date_str]
-                        if pd.isna(val):
-                            raise KeyError
-                        pc = ws.cell(row=current_row, column=col_num,
-                                     value=round(float(val), 1))
-                        pc.number_format = "0.0"
-                    except (KeyError, TypeError):
-                        pc = ws.cell(row=current_row, column=col_num, value="")
-                    pc.font = data_font; pc.alignment = center; pc.border = brd
-
-                current_row += 1
-
-        ws.freeze_panes = f"{get_column_letter(n_meta + 1)}2"
-
-    if single_sheet:
-        # Filtered mode one sheet with exactly the pre-filtered data
-        ws = wb.create_sheet(title=single_sheet)
-        _write_sheet(ws, df)
-    else:
-        # All data mode — 4 sheets split by breakfast/cancellation combo
-        for sheet_label, bf, fc_flag in FILTERS:
-            mask = (
-                (df["breakfast_included"] == bf) &
-                (df["free_cancellation"]  == fc_flag)
-            )
-            ws = wb.create_sheet(title=sheet_label)
-            _write_sheet(ws, df[mask].copy())
 
-    buf = io.BytesIO()
-    wb.save(buf)
-    return buf.getvalue()
+def _format_size(n_bytes: int) -> str:
+    if n_bytes < 1024 * 1024:
+        return f"{n_bytes / 1024:,.0f} KB"
+    return f"{n_bytes / (1024 * 1024):,.1f} MB"
  
  
+@st.cache_resource
+def _mailer() -> mailer.Mailer:
+    """Process-wide SMTP mailer: authenticated Gmail connections are reused across sends and sessions."""
+    return mailer.Mailer("smtp.gmail.com", 587,
+                         st.secrets["GMAIL_SENDER"], st.secrets["GMAIL_APP_PASSWORD"])
+
+
 def _send_matrix_email(recipients: list, subject: str, body: str,
-                        xlsx_bytes: bytes, filename: str):
-    """Send Excel matrix as attachment via Gmail SMTP."""
-    
+                        xlsx_bytes: bytes, filename: str,
+                        mime: str = matrix_excel.XLSX_MIME):
+    """Send the matrix file as attachment through the pooled Gmail SMTP mailer."""
+    matrix_pipeline.send_matrix_email(_mailer(), st.secrets["GMAIL_SENDER"], recipients,
+                                      subject, body, xlsx_bytes, filename, mime=mime)
+
+
+# ==================== MATRIX JOBS ====================
+# "Generate & Send Matrix" enqueues a job instead of running in the script.
+# A bounded in-process pool runs the query → build → email pipeline, and
+# MickeMatrixJobs records each job's parameters, progress and result so any
+# session (or a reconnected browser) can follow it. Built files are kept in
+# the matrix file cache under the job's artifact_key.
+#
+# Rows carry a 'created_month' bucket (YYYY-MM) so the job list is a Limit-ed
+# query per month instead of a table scan:
+#   aws dynamodb update-table --table-name MickeMatrixJobs \
+#     --attribute-definitions AttributeName=created_month,AttributeType=S AttributeName=created_at,AttributeType=S \
+#     --global-secondary-index-updates '[{"Create":{"IndexName":"created_month-created_at-index",
+#       "KeySchema":[{"AttributeName":"created_month","KeyType":"HASH"},{"AttributeName":"created_at","KeyType":"RANGE"}],
+#       "Projection":{"ProjectionType":"ALL"}}}]'
+# Rows written before the bucket existed drop out of the list; they expire
+# after MATRIX_JOB_TTL_DAYS anyway.
+#
+# 'email_status' tracks the send step on its own: 'sending' while the mailer
+# has the message, then 'sent', 'failed' (rejected, nothing delivered) or
+# 'unknown' (timed out — the server may still have accepted it).
+
+MATRIX_JOB_WORKERS       = 2
+MATRIX_JOB_POLL_SECONDS  = 3
+MATRIX_JOB_LIST_LIMIT    = 10
+MATRIX_JOB_STALE_MINUTES = 30      # no heartbeat for this long → shown as interrupted
+MATRIX_JOB_TTL_DAYS      = 30
+MATRIX_JOB_INDEX         = "created_month-created_at-index"
+
+MATRIX_JOB_WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+@st.cache_resource
+def _matrix_job_pool() -> ThreadPoolExecutor:
+    """Process-wide pool for matrix jobs, kept apart from the query pool its jobs fan out to."""
+    return ThreadPoolExecutor(max_workers=MATRIX_JOB_WORKERS, thread_name_prefix="matrix-job")
+
+
+@st.cache_resource
+def _active_matrix_jobs() -> dict:
+    """job_id -> Future for the jobs submitted by this process."""
+    return {}
+
+
+def _dynamo_value(value):
+    if isinstance(value, float):
+        return Decimal(str(round(value, 3)))
+    return value
+
+
+def _update_matrix_job(job_id: str, **fields):
+    """SET the given attributes (and the updated_at heartbeat) on a job row."""
+    fields['updated_at'] = datetime.now(FINLAND_TZ).isoformat()
+    names  = {f"#f{i}": name for i, name in enumerate(fields)}
+    values = {f":v{i}": _dynamo_value(value) for i, value in enumerate(fields.values())}
+    _thread_table(table_matrix_jobs.name).update_item(
+        Key={'job_id': job_id},
+        UpdateExpression="SET " + ", ".join(f"#f{i} = :v{i}" for i in range(len(fields))),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values
+    )
 
-    sender_email   = st.secrets["GMAIL_SENDER"]   
-    sender_password = st.secrets["GMAIL_APP_PASSWORD"] 
 
-    msg            = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"]    = sender_email
-    msg["To"]      = ", ".join(recipients)
-    msg.set_content(body)
+def _run_matrix_job(job_id: str, params: dict):
+    """Pool task: build and email one matrix, recording progress and outcome on the job row."""
+    def progress(message: str):
+        _update_matrix_job(job_id, progress=message)
 
-    msg.add_attachment(
-        xlsx_bytes,
-        maintype="application",
-        subtype="vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        filename=filename
-    )
+    try:
+        _update_matrix_job(job_id, status='running', progress='Starting',
+                           started_at=datetime.now(FINLAND_TZ).isoformat())
+        data, meta, artifact_key = matrix_pipeline.build_matrix_file(
+            _price_store(), _matrix_artifact_cache(), params, progress
+        )
+        filename      = matrix_pipeline.matrix_file_name(params, meta["filter_desc"])
+        subject, body = matrix_pipeline.matrix_email(params, meta)
+
+        _update_matrix_job(job_id, progress=f"Sending to {len(params['recipients'])} recipient(s)",
+                           email_status='sending', artifact_key=artifact_key, filename=filename, size_bytes=len(data),
+                           build_secs=meta.get("build_secs", 0.0), from_cache=meta["from_cache"],
+                           found_hotels=meta["found_hotels"],
+                           total_zone_hotels=meta["total_zone_hotels"])
+        try:
+            _send_matrix_email(
+                recipients=list(params['recipients']),
+                subject=subject,
+                body=body,
+                xlsx_bytes=data,
+                filename=filename,
+                mime=matrix_excel.EXPORT_FORMATS[params['format']][2]
+            )
+        except (TimeoutError, FutureTimeoutError) as email_err:
+            # Stopped waiting, not refused: the message may still be (or have been) delivered
+            _update_matrix_job(job_id, status='failed', progress='', email_status='unknown',
+                               error=f"Email delivery unconfirmed ({str(email_err) or 'timed out'}); it may "
+                                     f"still arrive. The file can be downloaded.",
+                               finished_at=datetime.now(FINLAND_TZ).isoformat())
+            return
+        except Exception as email_err:
+            _update_matrix_job(job_id, status='failed', progress='', email_status='failed',
+                               error=f"Email send failed: {email_err}. The file can still be downloaded.",
+                               finished_at=datetime.now(FINLAND_TZ).isoformat())
+            return
+        _update_matrix_job(job_id, status='succeeded', progress='', error='', email_status='sent',
+                           finished_at=datetime.now(FINLAND_TZ).isoformat())
+    except Exception as e:
+        log.warning("matrix job %s failed: %s", job_id, e)
+        try:
+            _update_matrix_job(job_id, status='failed', progress='', error=str(e),
+                               finished_at=datetime.now(FINLAND_TZ).isoformat())
+        except Exception:
+            log.exception("could not record failure of matrix job %s", job_id)
+
+
+def enqueue_matrix_job(params: dict) -> str:
+    """Record a queued job and hand it to the job pool. Returns the job id; raises on DynamoDB errors."""
+    # Resolve the process-wide resources here: a cache_resource miss on a job
+    # thread would try to draw its spinner outside any script run
+    _price_store(), _matrix_artifact_cache(), _mailer()
+
+    job_id = str(uuid.uuid4())
+    now    = datetime.now(FINLAND_TZ)
+    table_matrix_jobs.put_item(Item={
+        'job_id':     job_id,
+        'status':     'queued',
+        'params':     params,
+        'progress':   'Waiting for a worker',
+        'created_at': now.isoformat(),
+        'created_month': now.strftime("%Y-%m"),
+        'updated_at': now.isoformat(),
+        'created_by': st.session_state.get('authenticated_user', 'admin'),
+        'worker':     MATRIX_JOB_WORKER_ID,
+        'expires_at': int(now.timestamp()) + MATRIX_JOB_TTL_DAYS * 86400,
+    })
+    active = _active_matrix_jobs()
+
+    def job_done(_):
+        active.pop(job_id, None)
+        list_matrix_jobs.clear()    # the final row must not be shown from a stale listing
+
+    active[job_id] = future = _matrix_job_pool().submit(_run_matrix_job, job_id, params)
+    future.add_done_callback(job_done)
+    list_matrix_jobs.clear()
+    return job_id
+
+
+@st.cache_data(ttl=MATRIX_JOB_POLL_SECONDS)
+def list_matrix_jobs() -> list:
+    """
+    Most recent matrix jobs, newest first: Limit-ed descending queries of the
+    created_month index, newest month first. Scans only while the index does
+    not exist yet.
+    """
+    now  = datetime.now(FINLAND_TZ)
+    jobs = []
+    try:
+        for month in _month_buckets(now - timedelta(days=MATRIX_JOB_TTL_DAYS), now):
+            jobs += table_matrix_jobs.query(
+                IndexName=MATRIX_JOB_INDEX,
+                KeyConditionExpression=Key('created_month').eq(month),
+                ScanIndexForward=False,
+                Limit=MATRIX_JOB_LIST_LIMIT - len(jobs)
+            )['Items']
+            if len(jobs) >= MATRIX_JOB_LIST_LIMIT:
+                break
+        return jobs
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("ValidationException", "ResourceNotFoundException"):
+            log.warning("could not list matrix jobs: %s", e)
+            return []
+    except Exception as e:
+        log.warning("could not list matrix jobs: %s", e)
+        return []
 
-    with smtplib.SMTP("smtp.gmail.com", 587) as server:
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.send_message(msg)    
+    try:
+        jobs = scan_items(table_matrix_jobs)
+    except Exception as e:
+        log.warning("could not list matrix jobs: %s", e)
+        return []
+    jobs.sort(key=lambda j: j.get('created_at', ''), reverse=True)
+    return jobs[:MATRIX_JOB_LIST_LIMIT]
+
+
+def _matrix_job_status(job: dict) -> str:
+    """
+    The job's status, with queued/running jobs whose worker is gone reported as
+    'interrupted'. A job of this process that has left the registry is re-read
+    first, and `job` updated in place, since the listing may predate its last write.
+    """
+    status = job.get('status', '')
+    if status not in ('queued', 'running'):
+        return status
+    if job.get('worker') == MATRIX_JOB_WORKER_ID and job['job_id'] not in _active_matrix_jobs():
+        try:
+            job.update(table_matrix_jobs.get_item(Key={'job_id': job['job_id']}).get('Item') or {})
+        except Exception as e:
+            log.warning("could not re-read matrix job %s: %s", job['job_id'], e)
+        status = job.get('status', '')
+        return status if status not in ('queued', 'running') else 'interrupted'
+    heartbeat = job.get('updated_at', '')
+    if heartbeat and datetime.fromisoformat(heartbeat) < \
+            datetime.now(FINLAND_TZ) - timedelta(minutes=MATRIX_JOB_STALE_MINUTES):
+        return 'interrupted'
+    return status
+
+
+def _render_matrix_jobs(polling: bool):
+    """Job list for the Matrix Automation tab; run as a fragment that polls while jobs are active."""
+    jobs = list_matrix_jobs()
+    statuses = {job['job_id']: _matrix_job_status(job) for job in jobs}
+    if polling and not any(s in ('queued', 'running') for s in statuses.values()):
+        st.rerun()      # all done: one full rerun drops the polling fragment
+
+    if not jobs:
+        st.caption("No matrix jobs yet.")
+        return
+
+    badges = {'queued': "⏳ queued", 'running': "⚙️ running", 'succeeded': "✅ sent",
+              'failed': "❌ failed", 'interrupted': "⚠️ interrupted"}
+    cache = _matrix_artifact_cache()
+    for job in jobs:
+        params = job.get('params', {})
+        status = statuses[job['job_id']]
+        jc1, jc2, jc3 = st.columns([4, 4, 2])
+        with jc1:
+            st.markdown(f"**{params.get('zone', '')}** · {params.get('location', '').title()}")
+            st.caption(
+                f"{'+'.join(f'{int(p)}p' for p in params.get('persons', []))} · "
+                f"{'+'.join(params.get('times', []))} · {params.get('start_date', '')} · "
+                f"{int(params.get('days_forward', 0))} days · 📎 {params.get('format', 'xlsx')} · "
+                f"by {job.get('created_by', '?')} at {job.get('created_at', '')[:16].replace('T', ' ')}"
+            )
+        with jc2:
+            st.markdown(badges.get(status, status))
+            if status in ('queued', 'running'):
+                st.caption(job.get('progress', ''))
+            elif job.get('error'):
+                st.caption(job['error'])
+            elif status == 'succeeded':
+                source = "from cache" if job.get('from_cache') else f"built in {float(job.get('build_secs', 0)):.1f}s"
+                st.caption(
+                    f"{_format_size(int(job.get('size_bytes', 0)))} {source} · "
+                    f"{int(job.get('found_hotels', 0))} / {int(job.get('total_zone_hotels', 0))} hotels · "
+                    f"{len(params.get('recipients', []))} recipient(s)"
+                )
+        with jc3:
+            cached = cache.get(job['artifact_key']) if cache and job.get('artifact_key') else None
+            if cached is not None:
+                st.download_button(
+                    "⬇️ Download",
+                    data=cached[0],
+                    file_name=job.get('filename', 'price_matrix'),
+                    mime=matrix_excel.EXPORT_FORMATS[params.get('format', 'xlsx')][2],
+                    key=f"mx_job_dl_{job['job_id']}",
+                    use_container_width=True
+                )
+            if status in ('failed', 'interrupted'):
+                # A retry sends the email again: only offer it plainly when none can have gone out
+                may_be_sent = job.get('email_status') in ('sending', 'unknown')
+                if may_be_sent:
+                    st.caption("📧 The email may already have been delivered.")
+                if st.button("🔁 Retry anyway" if may_be_sent else "🔁 Retry",
+                             key=f"mx_job_retry_{job['job_id']}", use_container_width=True):
+                    enqueue_matrix_job(params)
+                    st.rerun()
 
 
 def get_color_from_availability(value, min_val, max_val):
@@ -1324,6 +2103,95 @@ def get_color_from_availability(value, min_val, max_val):
     
     return f"rgb({int(r)}, {int(g)}, {int(b)})"
 
+# ==================== DERIVED-ARTIFACT MEMO ====================
+# Every widget interaction reruns the script. Frames, figures and grid
+# options derived from the query results are kept in session_state under a
+# fingerprint of the inputs they depend on, and rebuilt only when it changes.
+
+def _session_memo(slot: str, build, **inputs):
+    """build() for these inputs, reused across reruns; one entry per slot per session."""
+    key  = matrix_cache.fingerprint(**inputs)
+    memo = st.session_state.setdefault('derived_memo', {})
+    hit  = memo.get(slot)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    value = build()
+    memo[slot] = (key, value)
+    return value
+
+
+def _assemble_price_grid(pivot: pd.DataFrame, numeric_cols: list) -> pd.DataFrame:
+    """
+    Lay out the detailed matrix rows in one pass: each scrape date's block
+    (in order of appearance) with a blank row between blocks, then a blank
+    row and the AVERAGE row when there are price columns. Every column is
+    allocated once at its final length and filled by position; blank cells
+    are NaN in price columns and None elsewhere.
+    """
+    codes, uniques = pd.factorize(pivot['scrape_date'])
+    order = np.argsort(codes, kind='stable')
+    # Row j of the date-ordered pivot lands after one separator per block before it
+    positions = np.arange(len(order)) + codes[order]
+    n_rows = len(order) + max(len(uniques) - 1, 0)
+    if numeric_cols:
+        averages = pivot.loc[pivot['scrape_date'].notnull(), numeric_cols].mean()
+        n_rows += 2
+
+    columns = {}
+    for col in pivot.columns:
+        values = pivot[col].to_numpy()
+        if col in numeric_cols:
+            out = np.full(n_rows, np.nan, dtype=values.dtype)
+        else:
+            out = np.full(n_rows, None, dtype=object)
+        out[positions] = values[order]
+        columns[col] = out
+
+    if numeric_cols:
+        columns['scrape_date'][-1] = 'AVERAGE'
+        columns['name'][-1] = 'AVERAGE'
+        for col in numeric_cols:
+            columns[col][-1] = round(averages[col], 2)
+    return pd.DataFrame(columns)
+
+
+def build_price_grid(filtered_df: pd.DataFrame) -> tuple:
+    """
+    Detailed price matrix for AgGrid: one row per scrape date × hotel and one
+    column per stay date, scrape dates separated by a blank row and an
+    AVERAGE row at the bottom. Returns (pivot, gridOptions).
+    """
+    pivot = filtered_df.pivot_table(
+        index=['scrape_date', 'name'], 
+        columns='price_date',
+        values='price', 
+        aggfunc='mean',
+        observed=True
+    )
+
+    pivot.columns = [col.strftime('%Y-%m-%d') if isinstance(col, pd.Timestamp) else col for col in pivot.columns]
+    pivot = pivot.reset_index()
+    pivot['scrape_date'] = pivot['scrape_date'].dt.strftime('%Y-%m-%d')
+    pivot['name'] = pivot['name'].astype(str)
+
+    numeric_cols = [col for col in pivot.columns if col not in ['scrape_date', 'name', 'breakfast_included']]
+    pivot = _assemble_price_grid(pivot, numeric_cols)
+
+    gb = GridOptionsBuilder.from_dataframe(pivot)
+    gb.configure_columns(['scrape_date', 'name'], pinned='left', minWidth=150)
+    gb.configure_columns(
+        numeric_cols,
+        type=['numericColumn'],
+        precision=2,
+        minWidth=100,
+        maxWidth=100
+    )
+    gb.configure_default_column(resizable=True)
+    gb.configure_grid_options(rowHeight=35)
+    gridOptions = gb.build()
+    return pivot, gridOptions
+
+
 # ==================== PAGE NAVIGATION ====================
 boards   = st.session_state.get("boards", [])
 is_admin = st.session_state.get("access") == "admin"
@@ -1549,43 +2417,46 @@ if tab1:
                 price_start = _ss.strftime("%d-%m-%Y")
                 price_end   = _se.strftime("%d-%m-%Y")
 
-            with st.spinner("🔍 Searching hotels..."):
-                filters = {
-                    "location": location,
-                    "time": time_of_day,
-                    "persons": str(persons),
-                    "nights": str(nights)
-                }
-                date_range = f"{price_start} - {price_end}"
-                results = query_hotels(
-                    filters=filters,
-                    date_range=date_range,
-                    scraped_date_start=scraped_start,
-                    scraped_date_end=scraped_end
-                )
+            filters = {
+                "location": location,
+                "time": time_of_day,
+                "persons": str(persons),
+                "nights": str(nights)
+            }
+            date_range = f"{price_start} - {price_end}"
+            results = query_hotels_progressive(
+                filters=filters,
+                date_range=date_range,
+                scraped_date_start=scraped_start,
+                scraped_date_end=scraped_end
+            )
 
-            if results:
+            if not results.empty:
                 st.session_state.results = results
+                st.session_state.results_id = uuid.uuid4().hex
                 st.success(f"✅ Found {len(results)} hotel records!")
             else:
                 st.error("❌ No data found for your criteria")
 
-        if 'results' in st.session_state and st.session_state.results:
-            df = pd.DataFrame(st.session_state.results)
-            df['price'] = pd.to_numeric(df['price'], errors='coerce')
-            df = df.dropna(subset=['price'])
+        if 'results' in st.session_state and not st.session_state.results.empty:
+            results_inputs = dict(results=st.session_state.get('results_id', ''),
+                                  breakfast=bool(breakfast_filter),
+                                  cancellation=bool(cancellation_filter))
+
+            def filter_results():
+                df = st.session_state.results.dropna(subset=['price'])
+                df = df[(df['breakfast_included'] == bool(breakfast_filter)) &
+                        (df['free_cancellation'] == bool(cancellation_filter))]
+                return df, sorted(df['name'].unique())
+
+            df, unique_hotels = _session_memo('price_filtered', filter_results, **results_inputs)
 
             if breakfast_filter and cancellation_filter:
-                df = df[(df['breakfast_included'] == True) & (df['free_cancellation'] == True)]
                 st.success(f"🍳✅ Filtered to {len(df)} records with breakfast included and free cancellation")
             elif breakfast_filter and not cancellation_filter:
-                df = df[(df['breakfast_included'] == True) & (df['free_cancellation'] == False)]
                 st.success(f"🍳 Filtered to {len(df)} records with breakfast included")
             elif cancellation_filter and not breakfast_filter:
-                df = df[(df['breakfast_included'] == False) & (df['free_cancellation'] == True)]
                 st.success(f"✅ Filtered to {len(df)} records with free cancellation")
-            else:
-                df = df[(df['breakfast_included'] == False) & (df['free_cancellation'] == False)]
             
             if not df.empty:
                 st.markdown('<div class="hotel-selector">', unsafe_allow_html=True)
@@ -1594,8 +2465,6 @@ if tab1:
                 with col1:
                     st.markdown("### 🏨 Hotel Selection")
                     
-                    unique_hotels = sorted(df['name'].unique())
-                    
                     if 'selected_hotels' not in st.session_state:
                         st.session_state.selected_hotels = []
                     if 'multiselect_key' not in st.session_state:
@@ -1674,7 +2543,7 @@ if tab1:
                 if 'show_rates_pricing' not in st.session_state:
                     st.session_state.show_rates_pricing = True
 
-                all_hotels = sorted(df['name'].unique())
+                all_hotels = unique_hotels
                 valid_defaults = [h for h in st.session_state.get('line_hotels', []) if h in all_hotels]
 
                 col_select, col_display = st.columns([3, 1])
@@ -1707,59 +2576,23 @@ if tab1:
                 st.markdown('</div>', unsafe_allow_html=True)
 
                 if hotels:
-                    filtered_df = df[df['name'].isin(hotels)].copy()
-                    filtered_df['price_date'] = pd.to_datetime(filtered_df['price_date'], format='%Y-%m-%d')
+                    selection_inputs = dict(results_inputs, hotels=list(hotels))
+                    filtered_df = _session_memo('price_selected', lambda: df[df['name'].isin(hotels)],
+                                                **selection_inputs)
 
                     # Bar chart data
-                    bar_avg = filtered_df.groupby('price_date')['price'].mean().reset_index()
-                    bar_avg['week_num'] = bar_avg['price_date'].dt.isocalendar().week
-                    bar_avg['x_label'] = make_x_label(bar_avg['price_date'])
-
                     price_color_ranges = st.session_state.get('price_color_ranges', get_default_color_ranges()['zone1'])
-                    bar_avg['bar_color'] = bar_avg['price'].apply(
-                        lambda x: get_color_from_price_ranges(x, price_color_ranges)
-                    )
 
-                    def add_week_annotations(fig, bar_avg):
-                        """Add week label bands below the x-axis spanning the full week."""
-                        x_labels = bar_avg['x_label'].tolist()
-
-                        for week_num, week_group in bar_avg.groupby('week_num'):
-                            x_indices = [x_labels.index(lbl) for lbl in week_group['x_label'] if lbl in x_labels]
-                            if not x_indices:
-                                continue
-
-                            x_start = min(x_indices) - 0.45
-                            x_end = max(x_indices) + 0.45
-                            mid_x = (x_start + x_end) / 2
-                            bg_color = st.get_option("theme.backgroundColor") or "#0e1117"
-
-                            fig.add_shape(
-                                type="rect",
-                                xref="x",
-                                yref="paper",
-                                x0=x_start,
-                                x1=x_end,
-                                y0=-0.27,
-                                y1=-0.18,
-                                fillcolor=bg_color,
-                                line=dict(color="white", width=2),
-                                layer="above"
-                            )
+                    def build_bar_avg():
+                        bar_avg = filtered_df.groupby('price_date')['price'].mean().reset_index()
+                        bar_avg['week_num'] = bar_avg['price_date'].dt.isocalendar().week
+                        bar_avg['x_label'] = make_x_label(bar_avg['price_date'])
+                        bar_avg['bar_color'] = color_scale(price_color_ranges).map(bar_avg['price'])
+                        return bar_avg
 
-                            fig.add_annotation(
-                                x=mid_x,
-                                y=-0.25,
-                                xref="x",
-                                yref="paper",
-                                text=f"<b>Week {week_num}</b>",
-                                showarrow=False,
-                                font=dict(size=12, color="white"),
-                                align="center",
-                            )
+                    bar_avg = _session_memo('price_bar_avg', build_bar_avg,
+                                            color_ranges=price_color_ranges, **selection_inputs)
 
-                        return fig
-                    
                     if 'std_top_value' not in st.session_state:
                         st.session_state.std_top_value = get_std_top_value()
                     
@@ -1768,18 +2601,22 @@ if tab1:
                     std_top = st.session_state.std_top_value    
 
                     # Build line_avg if line hotels selected
-                    line_avg = None
-                    if line_hotels:
-                        line_df = df[df['name'].isin(line_hotels)].copy()
-                        line_df['price'] = pd.to_numeric(line_df['price'], errors='coerce')
+                    def build_line_avg():
+                        line_df = df[df['name'].isin(line_hotels)]
                         pivot_line = line_df.pivot_table(
-                            index='scrape_date', columns='price_date', values='price', aggfunc='mean'
+                            index='scrape_date', columns='price_date', values='price', aggfunc='mean',
+                            observed=True
                         )
                         line_avg = pivot_line.mean(axis=0).reset_index()
                         line_avg.columns = ['price_date', 'price']
                         line_avg = line_avg.dropna(subset=['price'])
-                        line_avg['price_date'] = pd.to_datetime(line_avg['price_date'])
                         line_avg['x_label'] = make_x_label(line_avg['price_date'])
+                        return line_avg
+
+                    line_avg = None
+                    if line_hotels:
+                        line_avg = _session_memo('price_line_avg', build_line_avg,
+                                                 line_hotels=list(line_hotels), **results_inputs)
 
                     def build_bar_fig(title, show_labels=True, yaxis_range=None):
                         fig = px.bar(
@@ -1798,18 +2635,19 @@ if tab1:
                             fig.data[0].textposition = 'none'
                             fig.data[0].hovertemplate = '<b>%{x}</b><extra></extra>'
 
-                        # Scatter dots only if line hotels selected AND labels shown
+                        # Scatter dots only if line hotels selected AND labels shown:
+                        # one marker trace over the dates that also have a bar
                         if line_avg is not None and show_labels:
-                            for idx, line_row in line_avg.iterrows():
-                                matching_bar = bar_avg[bar_avg['price_date'] == line_row['price_date']]
-                                if not matching_bar.empty:
-                                    fig.add_scatter(
-                                        x=[matching_bar.iloc[0]['x_label']], y=[line_row['price']],
-                                        mode='markers', name='Trend',
-                                        marker=dict(color='red', size=14),
-                                        showlegend=(idx == 0),
-                                        hovertemplate='<b>Trend</b><br>Price: €%{y:.2f}<extra></extra>'
-                                    )
+                            trend = bar_avg[['price_date', 'x_label']].merge(
+                                line_avg[['price_date', 'price']], on='price_date'
+                            )
+                            if not trend.empty:
+                                fig.add_scatter(
+                                    x=trend['x_label'], y=trend['price'],
+                                    mode='markers', name='Trend',
+                                    marker=dict(color='red', size=14),
+                                    hovertemplate='<b>Trend</b><br>Price: €%{y:.2f}<extra></extra>'
+                                )
 
                         layout = dict(
                             height=550,
@@ -1829,77 +2667,30 @@ if tab1:
                             fig.update_yaxes(showticklabels=False, showgrid=False)
                             fig.update_xaxes(showgrid=False)
 
-                        fig = add_week_annotations(fig, bar_avg)
+                        fig = add_week_bands(fig, bar_avg['week_num'])
+                        if log.isEnabledFor(logging.DEBUG):
+                            log.debug("price bar figure: %d bars, %d traces, %d bytes JSON",
+                                      len(bar_avg), len(fig.data), len(fig.to_json()))
                         return fig
 
-                    # All 4 cases handled
-                    if show_rates_val and show_std_val:
-                        st.plotly_chart(build_bar_fig(f'Average Prices Across Selected Hotels', show_labels=True, yaxis_range=std_top), use_container_width=True)
-                    elif show_rates_val and not show_std_val:
-                        st.plotly_chart(build_bar_fig('Average Prices Across Selected Hotels', show_labels=True), use_container_width=True)
-                    elif show_std_val and not show_rates_val:
-                        st.plotly_chart(build_bar_fig(f'Average Prices Across Selected Hotels', show_labels=False, yaxis_range=std_top), use_container_width=True)
-                    else:
-                        # Both unchecked — bars with no labels (existing behaviour)
-                        st.plotly_chart(build_bar_fig('Average Prices Across Selected Hotels', show_labels=False), use_container_width=True)
+                    # Rates toggle the labels (and trend dots); the standardized
+                    # comparison pins the y axis to std_top
+                    bar_fig = _session_memo(
+                        'price_bar_fig',
+                        lambda: build_bar_fig('Average Prices Across Selected Hotels',
+                                              show_labels=show_rates_val,
+                                              yaxis_range=std_top if show_std_val else None),
+                        color_ranges=price_color_ranges, line_hotels=list(line_hotels),
+                        show_rates=bool(show_rates_val), show_std=bool(show_std_val),
+                        std_top=std_top, **selection_inputs
+                    )
+                    st.plotly_chart(bar_fig, use_container_width=True)
                     
                     # Detailed table section
                     st.markdown("### 📋 Detailed Price Matrix")
 
-                    pivot = filtered_df.pivot_table(
-                        index=['scrape_date', 'name'], 
-                        columns='price_date',
-                        values='price', 
-                        aggfunc='mean'
-                    )
-
-                    pivot.columns = [col.strftime('%Y-%m-%d') if isinstance(col, pd.Timestamp) else col for col in pivot.columns]
-                    pivot = pivot.reset_index()
-
-                    numeric_cols = [col for col in pivot.columns if col not in ['scrape_date', 'name', 'breakfast_included']]
-
-                    unique_dates = pivot['scrape_date'].unique()
-                    if len(unique_dates) > 1:
-                        final_pivot = pd.DataFrame()
-                        for i, date in enumerate(unique_dates):
-                            group = pivot[pivot['scrape_date'] == date]
-                            final_pivot = pd.concat([final_pivot, group], ignore_index=True)
-                            if i < len(unique_dates) - 1:
-                                empty_row = {col: None for col in pivot.columns}
-                                empty_df = pd.DataFrame([empty_row])
-                                final_pivot = pd.concat([final_pivot, empty_df], ignore_index=True)
-                        pivot = final_pivot
-
-                    if numeric_cols:
-                        valid_data = pivot[pivot['scrape_date'].notnull()]
-                        averages = valid_data[numeric_cols].mean()
-
-                        empty_row = {col: None for col in pivot.columns}
-                        empty_df = pd.DataFrame([empty_row])
-                        pivot = pd.concat([pivot, empty_df], ignore_index=True)
-
-                        avg_row = {'scrape_date': 'AVERAGE', 'name': 'AVERAGE'}
-                        for col in numeric_cols:
-                            if not pd.isna(averages[col]):
-                                avg_row[col] = round(averages[col], 2)
-                            else:
-                                avg_row[col] = None
-                        avg_df = pd.DataFrame([avg_row])
-                        pivot = pd.concat([pivot, avg_df], ignore_index=True)
-
-                    gb = GridOptionsBuilder.from_dataframe(pivot)
-                    gb.configure_columns(['scrape_date', 'name'], pinned='left', minWidth=150)
-                    gb.configure_columns(
-                        numeric_cols,
-                        type=['numericColumn'],
-                        precision=2,
-                        minWidth=100,
-                        maxWidth=100
-                    )
-                    gb.configure_default_column(resizable=True)
-                    gb.configure_grid_options(rowHeight=35)
-                    gridOptions = gb.build()
-
+                    pivot, gridOptions = _session_memo('price_grid', lambda: build_price_grid(filtered_df),
+                                                       **selection_inputs)
                     AgGrid(
                         pivot,
                         gridOptions=gridOptions,
@@ -2016,6 +2807,12 @@ if tab2:
                         calendar_start = None
                         calendar_end = None
 
+                cal_fetch_mode = st.radio(
+                    "Fetch mode", ["per_date", "range"],
+                    format_func=lambda m: {"per_date": "Per date", "range": "Single range"}[m],
+                    horizontal=True, key="cal_fetch_mode",
+                    help="Single range reads the whole period in a few large queries — faster for long periods."
+                )
             
             
             with st.expander("🎨 Color Configuration", expanded=True):
@@ -2053,19 +2850,32 @@ if tab2:
                 st.stop()
 
             with st.spinner("📊 Generating calendar data..."):
+                cal_timings = {}
                 st.session_state.calendar_data = query_calendar_data(
                     price_start_date=calendar_start,
                     price_end_date=calendar_end,
                     zone_filter=zone_selection,
-                    location=calendar_location
+                    location=calendar_location,
+                    timings=cal_timings,
+                    fetch_mode=cal_fetch_mode
                 )
+                st.session_state.calendar_timings = cal_timings
                 st.session_state.calendar_date_range = (calendar_start, calendar_end)
                 st.session_state.calendar_zone = zone_selection
                 st.session_state.calendar_location = calendar_location
         
         if 'calendar_data' in st.session_state:
             metrics = st.session_state.calendar_data
-            
+
+            cal_timings = st.session_state.get('calendar_timings')
+            if cal_timings:
+                st.caption(
+                    f"⏱️ {cal_timings['dates']} dates ({cal_timings['stored']} from store) · "
+                    f"{cal_timings['queries']} queries · {cal_timings['items']:,} items — "
+                    f"plan {cal_timings['plan']:.2f}s · store {cal_timings['store']:.2f}s · "
+                    f"fetch {cal_timings['fetch']:.2f}s · aggregate {cal_timings['aggregate']:.2f}s"
+                )
+
             df_cal_availability = pd.DataFrame({
                 'date': list(metrics['availability'].keys()),
                 'value': list(metrics['availability'].values())
@@ -2143,6 +2953,10 @@ if tab2:
                     st.warning("No data available for selected filters")
                 else:
                     day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+                    cal_scale = color_scale(st.session_state.color_ranges)
+                    filtered_cal_display['bg_color']   = cal_scale.map(filtered_cal_display['value'])
+                    filtered_cal_display['text_color'] = cal_scale.text_map(filtered_cal_display['value'])
                     
                     html = '<table class="calendar-table"><tr>'
                     html += '<td class="week-label"></td>'
@@ -2172,8 +2986,8 @@ if tab2:
                                 display_value = row_display['value']
                                 date_str = datetime.strptime(row_display['date_str'], "%m/%d/%Y").strftime("%d/%m/%Y")
                                 
-                                bg_color = get_color_from_price_ranges(display_value, st.session_state.color_ranges)
-                                text_color = get_text_color_from_background(bg_color)
+                                bg_color = row_display['bg_color']
+                                text_color = row_display['text_color']
                                 
                                 if color_metric == "availability":
                                     display_text = f"{display_value:.1f}%"
@@ -2260,19 +3074,24 @@ if tab_matrix:
                 min_value=1, max_value=365, value=365,
                 step=1, key="mx_days"
             )
-            mx_time = st.selectbox(
+            mx_times = st.multiselect(
                 "Scrape Time",
                 ["morning", "evening"],
-                key="mx_time",
-                help="Morning = AM scrape, Evening = PM scrape."
+                default=["morning"],
+                key="mx_times",
+                help="Morning = AM scrape, Evening = PM scrape. "
+                     "Several persons / times are queried together and combined in one file."
             )
-            mx_persons = st.selectbox(
+            mx_persons = st.multiselect(
                 "Persons",
                 [1, 2],
-                index=1,
+                default=[2],
                 key="mx_persons",
                 format_func=lambda x: f"{x} Person{'s' if x > 1 else ''}"
             )
+            # Keep the widget order stable whatever order the user clicked in
+            mx_times   = [t for t in ["morning", "evening"] if t in mx_times]
+            mx_persons = sorted(mx_persons)
             st.markdown("**🔽 Data Filters**")
             mx_filter_mode = st.radio(
                 "Include in Excel",
@@ -2286,6 +3105,14 @@ if tab_matrix:
             else:
                 mx_breakfast = None
                 mx_free_cancel = None
+            mx_format = st.selectbox(
+                "Attachment format",
+                list(matrix_excel.EXPORT_FORMATS),
+                format_func=_export_format_label,
+                key="mx_format",
+                help="Plain Excel, CSV and Parquet skip cell styling — smaller and faster "
+                     "for loading into other tools."
+            )
 
         with fc3:
             st.markdown("**📧 Email Recipients**")
@@ -2323,180 +3150,49 @@ if tab_matrix:
             errs = []
             if not mx_zone:
                 errs.append("Select a zone.")
+            if not mx_persons or not mx_times:
+                errs.append("Select at least one persons option and one scrape time.")
             if not all_recipients:
                 errs.append("Add at least one email recipient.")
             for err in errs:
                 st.error(err)
 
             if not errs:
-                start_dt = datetime(mx_start.year, mx_start.month, mx_start.day)
-
-                # ── Step 1: Query DynamoDB ────────────────────────────────
-                with st.status("🔍 Querying hotel prices…", expanded=True) as status:
-                    all_rows = []
-                    st.write(
-                        f"  › {mx_persons} person{'s' if mx_persons > 1 else ''} "
-                        f"/ {mx_time} scrape …"
-                    )
-                    rows = _query_matrix_data(
-                        location=mx_location,
-                        persons=mx_persons,
-                        time_val=mx_time,
-                        start_date=start_dt,
-                        days_forward=int(mx_days)
-                    )
-                    all_rows.extend(rows)
-                    st.write(f"    ✓ {len(rows):,} records")
-                    status.update(
-                        label=f"✅ {len(all_rows):,} records fetched",
-                        state="complete"
-                    )
-
-                if not all_rows:
-                    st.error(
-                        "❌ No data found for the selected scrape date and options. "
-                        "Check the scraper has run on this date for this location and time."
-                    )
-                else:
-                    df_raw = pd.DataFrame(all_rows)
-                    df_raw["price"] = pd.to_numeric(df_raw["price"], errors="coerce")
-                    df_raw = df_raw.dropna(subset=["price"])
-
-                    # ── Step 2: Filter by zone ────────────────────────────
-                    zone_hotels       = _resolve_zone_hotels(mx_zone, mx_location)
-                    df_zone           = df_raw[df_raw["name"].isin(zone_hotels)].copy()
-                    total_zone_hotels = len(zone_hotels)
-                    found_hotels      = df_zone["name"].nunique()
-
-                    st.info(
-                        f"🏨 **{found_hotels} / {total_zone_hotels}** zone hotels "
-                        f"have data.  "
-                        f"Total price records: **{len(df_zone):,}**."
+                try:
+                    enqueue_matrix_job({
+                        'location':     mx_location,
+                        'zone':         mx_zone,
+                        'zone_hotels':  _resolve_zone_hotels(mx_zone, mx_location),
+                        'persons':      mx_persons,
+                        'times':        mx_times,
+                        'start_date':   mx_start.strftime("%Y-%m-%d"),
+                        'days_forward': int(mx_days),
+                        'filter_mode':  mx_filter_mode,
+                        'breakfast':    bool(mx_breakfast),
+                        'free_cancel':  bool(mx_free_cancel),
+                        'format':       mx_format,
+                        'recipients':   all_recipients,
+                    })
+                    st.success(
+                        f"✅ Matrix queued — it will be emailed to **{', '.join(all_recipients)}** "
+                        f"when ready. Follow it below."
                     )
+                except Exception as e:
+                    st.error(f"❌ Could not queue the matrix job: {e}")
 
-                    if df_zone.empty:
-                        st.error(
-                            "❌ None of the zone hotels have data "
-                            "for the selected scrape date."
-                        )
-                    else:
-                        # ── Step 3: Apply breakfast/cancellation filter ───
-                        if mx_filter_mode == "Apply filters":
-                            df_excel = df_zone.copy()
-
-                            if mx_breakfast and mx_free_cancel:
-                                df_excel = df_excel[
-                                    (df_excel["breakfast_included"] == True) &
-                                    (df_excel["free_cancellation"] == True)
-                                ]
-                                filter_desc = "Breakfast_FreeCancel"
-                            elif mx_breakfast and not mx_free_cancel:
-                                df_excel = df_excel[
-                                    (df_excel["breakfast_included"] == True) &
-                                    (df_excel["free_cancellation"] == False)
-                                ]
-                                filter_desc = "Breakfast"
-                            elif mx_free_cancel and not mx_breakfast:
-                                df_excel = df_excel[
-                                    (df_excel["breakfast_included"] == False) &
-                                    (df_excel["free_cancellation"] == True)
-                                ]
-                                filter_desc = "FreeCancel"
-                            else:
-                                # Both unchecked — no extras
-                                df_excel = df_excel[
-                                    (df_excel["breakfast_included"] == False) &
-                                    (df_excel["free_cancellation"] == False)
-                                ]
-                                filter_desc = "NoExtras"
-
-                            if df_excel.empty:
-                                st.error("❌ No records match the selected filters. Try different filter options.")
-                                st.stop()
-
-                            st.info(f"🔽 Filter applied — **{filter_desc.replace('_', ' + ')}**: {len(df_excel):,} records")
-
-                        else:
-                            df_excel = df_zone.copy()
-                            filter_desc = "all"
-
-                        # ── Step 4: Build Excel ───────────────────────────
-                        with st.spinner("📊 Building Excel matrix…"):
-                            xlsx_bytes = _build_excel_matrix(
-                                df=df_excel,
-                                zone_name=mx_zone,
-                                location=mx_location,
-                                persons_list=[mx_persons],
-                                single_sheet=filter_desc.replace("_", " + ") if mx_filter_mode == "Apply filters" else None,
-                            )
-
-                        persons_str = f"{mx_persons}p"
-                        filename    = (
-                            f"price_matrix_{mx_location}_"
-                            f"{mx_zone.replace(' ', '_')}_"
-                            f"{mx_start.strftime('%Y%m%d')}_"
-                            f"{mx_time}_"
-                            f"{filter_desc}.xlsx"
-                        )
-                        subject = (
-                            f"Hotel Price Matrix – {mx_location.title()} | "
-                            f"{mx_zone} | {persons_str} | "
-                            f"{mx_time.title()} | "
-                            f"{mx_start.strftime('%d/%m/%Y')}"
-                        )
-                        body = (
-                            f"Please find attached the hotel price matrix.\n\n"
-                            f"Location  : {mx_location.title()}\n"
-                            f"Zone      : {mx_zone}\n"
-                            f"Persons   : {persons_str}\n"
-                            f"Scrape    : {mx_time}\n"
-                            f"Start date: {mx_start.strftime('%d/%m/%Y')}\n"
-                            f"Days fwd  : {int(mx_days)}\n"
-                            f"Filter    : {filter_desc.replace('_', ' + ')}\n"
-                            f"Hotels    : {found_hotels} of "
-                            f"{total_zone_hotels} in zone\n"
-                            f"Generated : "
-                            f"{datetime.now().strftime('%d/%m/%Y %H:%M')}\n\n"
-                            f"Sent from the Hotel Dashboard."
-                        )
-
-                        # ── Step 5: Send email ────────────────────────────
-                        with st.spinner(
-                            f"📧 Sending to {len(all_recipients)} recipient(s)…"
-                        ):
-                            try:
-                                _send_matrix_email(
-                                    recipients=all_recipients,
-                                    subject=subject,
-                                    body=body,
-                                    xlsx_bytes=xlsx_bytes,
-                                    filename=filename
-                                )
-                                st.success(
-                                    f"✅ Matrix emailed to: "
-                                    f"**{', '.join(all_recipients)}**"
-                                )
-                            except Exception as email_err:
-                                st.error(f"❌ Email send failed: {email_err}")
-                                st.warning("Download the file below.")
-
-                        # Always offer local download as fallback
-                        st.download_button(
-                            label="⬇️ Download Matrix Excel",
-                            data=xlsx_bytes,
-                            file_name=filename,
-                            mime=(
-                                "application/vnd.openxmlformats-"
-                                "officedocument.spreadsheetml.sheet"
-                            ),
-                            use_container_width=True
-                        )
+        # ── Jobs: polls every few seconds while any job is queued or running ──
+        st.markdown("### 🗂️ Recent Matrix Jobs")
+        mx_polling = any(_matrix_job_status(job) in ('queued', 'running')
+                         for job in list_matrix_jobs())
+        st.fragment(run_every=MATRIX_JOB_POLL_SECONDS if mx_polling else None)(
+            _render_matrix_jobs
+        )(mx_polling)
 
 if admin_panel:
     with admin_panel:
 
         try:
-            users = table_user.scan().get("Items", [])
+            users = scan_items(table_user)
         except Exception as e:
             st.error(f"Failed to load users: {e}")
             users = []
@@ -2518,39 +3214,35 @@ if admin_panel:
                 else:
                     with st.spinner("Preparing login logs..."):
                         try:
-                            response = table_logs.scan(
-                                FilterExpression=Attr("login_date").between(
-                                    log_start.strftime("%Y-%m-%d"),
-                                    log_end.strftime("%Y-%m-%d")
-                                )
-                            )
-                            items = response.get("Items", [])
-                            while "LastEvaluatedKey" in response:
-                                response = table_logs.scan(
-                                    FilterExpression=Attr("login_date").between(
-                                        log_start.strftime("%Y-%m-%d"),
-                                        log_end.strftime("%Y-%m-%d")
-                                    ),
-                                    ExclusiveStartKey=response["LastEvaluatedKey"]
-                                )
-                                items.extend(response.get("Items", []))
+                            xlsx_bytes, n_logs, used_index = export_login_logs(log_start, log_end)
 
-                            if not items:
+                            if not n_logs:
                                 st.warning("No login logs found for selected range")
                             else:
-                                df_logs = pd.DataFrame(items).sort_values("login_ts", ascending=False)
-                                buffer = io.BytesIO()
-                                with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-                                    df_logs.to_excel(writer, index=False, sheet_name="Login Logs")
+                                if not used_index:
+                                    st.caption("⚠️ Login month index not available or older rows still need "
+                                               "the login_month backfill — exported with a full table scan.")
                                 st.download_button(
-                                    label="📥 Download Login Logs",
-                                    data=buffer.getvalue(),
+                                    label=f"📥 Download Login Logs ({n_logs:,} rows)",
+                                    data=xlsx_bytes,
                                     file_name=f"login_logs_{log_start}_{log_end}.xlsx",
                                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                                 )
                         except Exception as e:
                             st.error(f"Failed to generate logs: {e}")
 
+            st.divider()
+            idx_col, backfill_col = st.columns([3, 1])
+            with idx_col:
+                st.caption(f"Login month index `{LOGIN_LOG_INDEX}`: **{login_log_index_status()}**")
+            with backfill_col:
+                if st.button("Backfill login_month", key="backfill_login_months_btn", use_container_width=True):
+                    with st.spinner("Backfilling login_month on older log rows..."):
+                        try:
+                            st.success(f"✅ Updated {backfill_login_months():,} rows")
+                        except Exception as e:
+                            st.error(f"Backfill failed: {e}")
+
         # ---- 2. Member Accounts ----
         with st.expander("👥 Member Accounts", expanded=False):
 
@@ -2710,11 +3402,7 @@ if admin_panel:
         with st.expander("🎨 Color Configuration Management", expanded=False):
 
             try:
-                response = table_color.scan()
-                color_configs = response.get('Items', [])
-                while 'LastEvaluatedKey' in response:
-                    response = table_color.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-                    color_configs.extend(response.get('Items', []))
+                color_configs = scan_items(table_color)
             except Exception as e:
                 st.error(f"Failed to load color configs: {e}")
                 color_configs = []
@@ -2967,6 +3655,153 @@ if admin_panel:
                 if save_std_top_value(st.session_state.std_top_value):
                     st.success(f"✅ Saved! All users will see max €{st.session_state.std_top_value}")
         
+        # ---- 5. Calendar Aggregate Store ----
+        with st.expander("🗓️ Calendar Aggregate Store", expanded=False):
+            st.caption(
+                "Stores finished per-date calendar metrics in HotelPricesCalendar so the "
+                "Historical Calendar reads them instead of recomputing from raw prices. "
+                "Only dates whose 30-day scrape window has closed (before today) are written, "
+                "for the locations and zones the calendar computes."
+            )
+            mc1, mc2, mc3, mc4 = st.columns([2, 2, 2, 2])
+            with mc1:
+                mat_location = st.selectbox("Location", CALENDAR_LOCATIONS, key="mat_location")
+            with mc2:
+                mat_zone = st.selectbox("Zone", list(CALENDAR_ZONES), key="mat_zone")
+            with mc3:
+                mat_start = st.date_input("Start Date", value=datetime.now() - timedelta(days=90),
+                                          key="mat_start")
+            with mc4:
+                mat_end = st.date_input("End Date", value=datetime.now() - timedelta(days=1),
+                                        key="mat_end")
+
+            if st.button("💾 Materialize", key="mat_run_btn", use_container_width=True, type="primary"):
+                if mat_start > mat_end:
+                    st.error("Start date must be before end date")
+                else:
+                    with st.spinner("Computing and storing calendar aggregates…"):
+                        try:
+                            written = materialize_calendar_aggregates(
+                                mat_start, mat_end, zone_filter=mat_zone, location=mat_location
+                            )
+                            st.success(f"✅ Stored {written} date(s) for {mat_zone} · {mat_location}.")
+                        except Exception as e:
+                            st.error(f"Materialization failed: {e}")
+
+        # ---- 6. Query Cache ----
+        with st.expander("⚡ Query Cache", expanded=False):
+            st.caption(
+                "Process-wide cache of Price Dashboard query results, shared by all users. "
+                "Results are held per scrape date; "
+                f"today's segments expire after {QUERY_CACHE_TTL_OPEN}s, "
+                f"past ones after {QUERY_CACHE_TTL_CLOSED // 3600}h."
+            )
+            qc_stats = _query_result_cache().stats()
+            qc1, qc2, qc3, qc4, qc5 = st.columns(5)
+            qc1.metric("Hits", f"{qc_stats['hits']:,}")
+            qc2.metric("Misses", f"{qc_stats['misses']:,}")
+            qc3.metric("Hit rate", f"{qc_stats['hit_rate']:.0%}")
+            qc4.metric("Entries", f"{qc_stats['entries']:,}")
+            qc5.metric("Size", f"{qc_stats['bytes'] / 1e6:,.1f} / {qc_stats['max_bytes'] / 1e6:,.0f} MB")
+            st.caption(f"Evictions: {qc_stats['evictions']:,}")
+            if st.button("🧹 Clear cache", key="query_cache_clear_btn"):
+                _query_result_cache().clear()
+                st.rerun()
+
+        # ---- 7. Matrix File Cache ----
+        with st.expander("📦 Matrix File Cache", expanded=False):
+            mf_cache = _matrix_artifact_cache()
+            if mf_cache is None:
+                st.info("Set `MATRIX_CACHE_DIR` in Streamlit secrets to enable the matrix file cache.")
+            else:
+                st.caption(
+                    f"Generated matrix files under `{MATRIX_CACHE_DIR}`, keyed by the request and the "
+                    "newest scrape date of its partition. Least recently used files are evicted "
+                    f"beyond {matrix_pipeline.MATRIX_CACHE_MAX_BYTES / 1e6:,.0f} MB."
+                )
+                mc_stats = mf_cache.stats()
+                mc1, mc2, mc3, mc4 = st.columns(4)
+                mc1.metric("Hits", f"{mc_stats['hits']:,}")
+                mc2.metric("Misses", f"{mc_stats['misses']:,}")
+                mc3.metric("Files", f"{mc_stats['entries']:,}")
+                mc4.metric("Size", f"{mc_stats['bytes'] / 1e6:,.1f} / {mc_stats['max_bytes'] / 1e6:,.0f} MB")
+                st.caption(f"Evictions: {mc_stats['evictions']:,}")
+                if st.button("🧹 Clear matrix cache", key="matrix_cache_clear_btn"):
+                    mf_cache.clear()
+                    st.rerun()
+
+        # ---- 8. Mail Delivery ----
+        with st.expander("✉️ Mail Delivery", expanded=False):
+            st.caption(
+                "Matrix emails go through a process-wide queue that reuses authenticated "
+                "Gmail connections and retries transient failures with backoff."
+            )
+            ml_stats = _mailer().stats()
+            ml1, ml2, ml3, ml4, ml5 = st.columns(5)
+            ml1.metric("Sent", f"{ml_stats['sent']:,}")
+            ml2.metric("Failed", f"{ml_stats['failed']:,}")
+            ml3.metric("Retries", f"{ml_stats['retries']:,}")
+            ml4.metric("Connections", f"{ml_stats['connections']:,}")
+            ml5.metric("Latency p50 / p95",
+                       f"{ml_stats['latency_p50']:.1f} / {ml_stats['latency_p95']:.1f} s"
+                       if ml_stats['latency_p50'] is not None else "—")
+
+        # ---- 9. Local Parquet Mirror ----
+        with st.expander("🗄️ Local Parquet Mirror", expanded=False):
+            if not HOTEL_MIRROR_DIR:
+                st.info("Set `HOTEL_MIRROR_DIR` in Streamlit secrets to enable the local HotelPrices mirror.")
+            else:
+                st.caption(
+                    f"Mirror root: `{HOTEL_MIRROR_DIR}`. Queries read scrape dates up to each "
+                    "partition's last complete date from Parquet and the rest from DynamoDB. "
+                    "Schedule `python -m hotel_mirror sync` to keep it current."
+                )
+                mirror_rows = []
+                for m_loc in ALL_LOCATIONS:
+                    for m_persons in hotel_mirror.DEFAULT_PERSONS:
+                        for m_nights in hotel_mirror.DEFAULT_NIGHTS:
+                            for m_time in hotel_mirror.DEFAULT_TIMES:
+                                done = hotel_mirror.last_complete(HOTEL_MIRROR_DIR, m_loc,
+                                                                  m_persons, m_nights, m_time)
+                                if done:
+                                    mirror_rows.append({'location': m_loc, 'persons': m_persons,
+                                                        'nights': m_nights, 'time': m_time,
+                                                        'last_complete': done})
+                if mirror_rows:
+                    st.dataframe(pd.DataFrame(mirror_rows), hide_index=True, use_container_width=True)
+                else:
+                    st.info("Nothing mirrored yet.")
+
+                ms1, ms2, ms3 = st.columns([2, 2, 1])
+                with ms1:
+                    mirror_loc = st.selectbox("Location", ALL_LOCATIONS, key="mirror_sync_loc")
+                with ms2:
+                    mirror_since = st.date_input(
+                        "First scrape date (first sync only)",
+                        value=datetime.now() - timedelta(days=30), key="mirror_sync_since"
+                    )
+                with ms3:
+                    st.markdown("<div style='margin-top: 28px;'></div>", unsafe_allow_html=True)
+                    mirror_sync_btn = st.button("🔄 Sync", key="mirror_sync_btn", use_container_width=True)
+
+                if mirror_sync_btn:
+                    with st.status(f"Syncing {mirror_loc}…", expanded=True) as mirror_status:
+                        try:
+                            total = 0
+                            for m_persons in hotel_mirror.DEFAULT_PERSONS:
+                                for m_nights in hotel_mirror.DEFAULT_NIGHTS:
+                                    for m_time in hotel_mirror.DEFAULT_TIMES:
+                                        first_run = not hotel_mirror.last_complete(
+                                            HOTEL_MIRROR_DIR, mirror_loc, m_persons, m_nights, m_time)
+                                        total += hotel_mirror.sync_partition(
+                                            table, HOTEL_MIRROR_DIR, mirror_loc, m_persons, m_nights, m_time,
+                                            since=mirror_since.strftime("%Y-%m-%d") if first_run else None,
+                                            log=st.write
+                                        )
+                            mirror_status.update(label=f"✅ Synced {total:,} rows", state="complete")
+                        except Exception as e:
+                            mirror_status.update(label=f"❌ Sync failed: {e}", state="error")
+
         # ---- 3. Zone Management ────────────────────────────────────────────
         with st.expander("🗺️ Zone Management", expanded=False):
             # ── Create New Zone ──────────────────────────────────────────────
@@ -3203,6 +4038,12 @@ if admin_panel:
                     key="new_auto_free_cancel",
                     disabled=(auto_filter_mode == "All data (no filter)")
                 )
+            auto_format = st.selectbox(
+                "Attachment format",
+                list(matrix_excel.EXPORT_FORMATS),
+                format_func=_export_format_label,
+                key="new_auto_format"
+            )
 
             # Row 4: Schedule — outside form so day picker shows/hides live
             st.markdown("**⏱️ Schedule**")
@@ -3263,7 +4104,7 @@ if admin_panel:
                 all_recip = list(dict.fromkeys(auto_recipients + extra))
 
                 auto_filter_desc = (
-                    _filter_desc_from_flags(auto_breakfast, auto_free_cancel)
+                    matrix_pipeline.filter_desc_from_flags(auto_breakfast, auto_free_cancel)
                     if auto_filter_mode == "Apply filters"
                     else "all"
                 )
@@ -3308,6 +4149,7 @@ if admin_panel:
                                 'filter_breakfast':          auto_breakfast if auto_filter_mode == "Apply filters" else False,
                                 'filter_free_cancel':        auto_free_cancel if auto_filter_mode == "Apply filters" else False,
                                 'filter_desc':               auto_filter_desc,
+                                'export_format':             auto_format,
                                 'schedule_type':             'daily' if sched_type == "Every day" else 'weekly',
                                 'schedule_dow':              auto_dow or '',
                                 'schedule_hour_finland':     auto_fin_hour,
@@ -3375,7 +4217,7 @@ if admin_panel:
                             st.caption(
                                 f"{auto.get('location','')} · {auto.get('zone','')} · "
                                 f"{auto.get('persons','')}p · {auto.get('time_val','')} · "
-                                f"🔽 {filter_disp}"
+                                f"🔽 {filter_disp} · 📎 {auto.get('export_format', 'xlsx')}"
                             )
                         with sc2:
                             st.markdown(f"🗓️ {freq_desc}")
@@ -3534,6 +4376,15 @@ if admin_panel:
                                 key=f"e_free_cancel_{aid}",
                                 disabled=(e_filter_mode == "All data (no filter)")
                             )
+                        e_format_options = list(matrix_excel.EXPORT_FORMATS)
+                        e_format = st.selectbox(
+                            "Attachment format",
+                            e_format_options,
+                            index=(e_format_options.index(auto.get('export_format', 'xlsx'))
+                                   if auto.get('export_format') in e_format_options else 0),
+                            format_func=_export_format_label,
+                            key=f"e_format_{aid}"
+                        )
 
                         # Edit schedule — live reactive
                         st.markdown("**⏱️ Schedule**")
@@ -3607,7 +4458,7 @@ if admin_panel:
                                 e_all_recip  = list(dict.fromkeys(e_recipients + e_extra_list))
 
                                 e_filter_desc = (
-                                    _filter_desc_from_flags(e_breakfast, e_free_cancel)
+                                    matrix_pipeline.filter_desc_from_flags(e_breakfast, e_free_cancel)
                                     if e_filter_mode == "Apply filters"
                                     else "all"
                                 )
@@ -3635,7 +4486,7 @@ if admin_panel:
                                                 "SET #n=:n, #loc=:l, #z=:z, persons=:p, "
                                                 "time_val=:t, days_forward=:df, "
                                                 "filter_mode=:fm, filter_breakfast=:fb, "
-                                                "filter_free_cancel=:ffc, filter_desc=:fd, "
+                                                "filter_free_cancel=:ffc, filter_desc=:fd, export_format=:xf, "
                                                 "schedule_type=:st, schedule_dow=:sd, "
                                                 "schedule_hour_finland=:sfh, schedule_cron=:sc, "
                                                 "recipients=:r, enabled=:e"
@@ -3656,6 +4507,7 @@ if admin_panel:
                                                 ':fb':  e_breakfast if e_filter_mode == "Apply filters" else False,
                                                 ':ffc': e_free_cancel if e_filter_mode == "Apply filters" else False,
                                                 ':fd':  e_filter_desc,
+                                                ':xf':  e_format,
                                                 ':st':  'daily' if e_sched_type == "Every day" else 'weekly',
                                                 ':sd':  e_dow or '',
                                                 ':sfh': e_fin_hour,
@@ -0,0 +1,308 @@
+"""
+Local Parquet mirror of the HotelPrices table.
+
+HotelPrices is an append-only time series: once a scrape date is over, its
+rows never change. This module copies it into a hive-partitioned Parquet
+dataset on local disk so dashboards can read history without DynamoDB:
+
+    <root>/location=<l>/persons=<p>/nights=<n>/time=<t>/scraped_date=<YYYY-MM-DD>/part-0.parquet
+
+Each (location, persons, nights, time) partition keeps a small
+`_sync_state.json` recording the contiguous range of *complete* scrape
+dates (`first_complete`..`last_complete`). A sync re-reads everything after
+it (today's partial date included) and only advances the marker over dates
+that are already in the past, so re-running it is always safe.
+
+Run from cron / a scheduled task:
+
+    python -m hotel_mirror sync --root /data/hotel_mirror --location tampere oulu
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+
+import boto3
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytz
+from boto3.dynamodb.conditions import Key
+
+FINLAND_TZ = pytz.timezone('Europe/Helsinki')
+
+DEFAULT_PERSONS = [1, 2]
+DEFAULT_NIGHTS  = [1, 2, 3, 7]
+DEFAULT_TIMES   = ["morning", "evening"]
+
+STATE_FILE = "_sync_state.json"
+
+# Column layout of every part file. scraped_date is not stored in the file —
+# it comes from the hive partition directory.
+SCHEMA = pa.schema([
+    ('hotel_id',           pa.string()),
+    ('hotel_name',         pa.string()),
+    ('price',              pa.float64()),
+    ('checkin_date',       pa.string()),
+    ('checkout_date',      pa.string()),
+    ('location',           pa.string()),
+    ('persons',            pa.int16()),
+    ('nights',             pa.int16()),
+    ('time',               pa.string()),
+    ('review_score',       pa.float64()),
+    ('city',               pa.string()),
+    ('distance',           pa.string()),
+    ('hotel_url',          pa.string()),
+    ('breakfast_included', pa.bool_()),
+    ('free_cancellation',  pa.bool_()),
+])
+
+_PARTITIONING = ds.partitioning(pa.schema([('scraped_date', pa.string())]), flavor="hive")
+
+# Columns of a read: the file columns plus the partition directory's scraped_date
+READ_SCHEMA = SCHEMA.append(pa.field('scraped_date', pa.string()))
+
+
+# ==================== LAYOUT ====================
+
+def partition_root(root: str, location: str, persons, nights, time_val: str) -> str:
+    return os.path.join(root, f"location={location}", f"persons={persons}",
+                        f"nights={nights}", f"time={time_val}")
+
+
+def _read_state(part_root: str) -> dict:
+    try:
+        with open(os.path.join(part_root, STATE_FILE)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_state(part_root: str, state: dict):
+    tmp = os.path.join(part_root, STATE_FILE + ".tmp")
+    with open(tmp, "w") as fh:
+        json.dump(state, fh)
+    os.replace(tmp, os.path.join(part_root, STATE_FILE))
+
+
+def last_complete(root: str, location: str, persons, nights, time_val: str):
+    """Last scrape date fully mirrored for this partition, or None."""
+    if not root:
+        return None
+    return _read_state(partition_root(root, location, persons, nights, time_val)).get("last_complete")
+
+
+def _shift_day(date_str: str, days: int) -> str:
+    return (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def _first_complete(state: dict):
+    """
+    First scrape date of the complete range. State files written before the
+    lower bound was tracked have an unknown range and count as uncovered.
+    """
+    return state.get("first_complete") if state.get("last_complete") else None
+
+
+# ==================== SYNC ====================
+
+def _to_float(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value):
+    f = _to_float(value)
+    return int(f) if f is not None else None
+
+
+def _to_str(value):
+    if value is None:
+        return None
+    return str(value)
+
+
+def _items_to_table(items: list) -> pa.Table:
+    columns = {name: [] for name in SCHEMA.names}
+    for item in items:
+        sort_key = item.get('scraped_date#hotel_id#checkin_date#checkout_date', '')
+        parts    = sort_key.split('#')
+        columns['hotel_id'].append(_to_str(item.get('hotel_id', parts[1] if len(parts) > 1 else None)))
+        columns['hotel_name'].append(_to_str(item.get('hotel_name', '')))
+        columns['price'].append(_to_float(item.get('price')))
+        columns['checkin_date'].append(_to_str(item.get('checkin_date', '')))
+        columns['checkout_date'].append(_to_str(item.get('checkout_date', parts[3] if len(parts) > 3 else None)))
+        columns['location'].append(_to_str(item.get('location', '')))
+        columns['persons'].append(_to_int(item.get('persons')))
+        columns['nights'].append(_to_int(item.get('nights')))
+        columns['time'].append(_to_str(item.get('time', '')))
+        columns['review_score'].append(_to_float(item.get('review_score')))
+        columns['city'].append(_to_str(item.get('city', '')))
+        columns['distance'].append(_to_str(item.get('distance', '')))
+        columns['hotel_url'].append(_to_str(item.get('hotel_url', '')))
+        columns['breakfast_included'].append(bool(item.get('breakfast_included', False)))
+        columns['free_cancellation'].append(bool(item.get('free_cancellation', False)))
+    return pa.table(columns, schema=SCHEMA)
+
+
+def _query_scrape_date(table, partition_key: str, scraped_date: str) -> list:
+    key_condition = (
+        Key('location#persons#nights#time').eq(partition_key) &
+        Key('scraped_date#hotel_id#checkin_date#checkout_date')
+            .between(f"{scraped_date}#", f"{scraped_date}~")
+    )
+    response = table.query(KeyConditionExpression=key_condition)
+    items = response['Items']
+    while 'LastEvaluatedKey' in response:
+        response = table.query(KeyConditionExpression=key_condition,
+                               ExclusiveStartKey=response['LastEvaluatedKey'])
+        items.extend(response['Items'])
+    return items
+
+
+def sync_partition(table, root: str, location: str, persons, nights, time_val: str,
+                   since: str = None, until: str = None, log=print) -> int:
+    """
+    Mirror every scrape date after the partition's last complete one (or from
+    `since`) up to `until` (default: today, Finland time). Returns rows written.
+    """
+    part_root = partition_root(root, location, persons, nights, time_val)
+    os.makedirs(part_root, exist_ok=True)
+
+    today = datetime.now(FINLAND_TZ).strftime("%Y-%m-%d")
+    state = _read_state(part_root)
+    if since is None:
+        if not state.get("last_complete"):
+            raise ValueError(f"{part_root} has never been synced — pass --since for the first run")
+        since = _shift_day(state["last_complete"], 1)
+    until = until or today
+    first_done = _first_complete(state)
+    last_done  = state.get("last_complete") if first_done else None
+
+    partition_key = f"{location}#{persons}#{nights}#{time_val}"
+    written = 0
+    d = datetime.strptime(since, "%Y-%m-%d")
+    while d.strftime("%Y-%m-%d") <= until:
+        scraped_date = d.strftime("%Y-%m-%d")
+        items = _query_scrape_date(table, partition_key, scraped_date)
+
+        date_dir = os.path.join(part_root, f"scraped_date={scraped_date}")
+        if items:
+            os.makedirs(date_dir, exist_ok=True)
+            tmp = os.path.join(date_dir, ".part-0.parquet.tmp")   # dot-files are ignored by readers
+            pq.write_table(_items_to_table(items), tmp, compression="zstd")
+            os.replace(tmp, os.path.join(date_dir, "part-0.parquet"))
+            written += len(items)
+        log(f"{partition_key} {scraped_date}: {len(items):,} rows")
+
+        # Dates since..scraped_date are now complete. Record them only as one
+        # contiguous range: a run that starts past a gap replaces the old
+        # range, and a backfill joins the existing one once it reaches it.
+        if scraped_date < today:
+            if last_done is None or since > _shift_day(last_done, 1):
+                first_done, last_done = since, scraped_date
+            elif scraped_date >= _shift_day(first_done, -1):
+                first_done, last_done = min(first_done, since), max(last_done, scraped_date)
+            if (first_done, last_done) != (state.get("first_complete"), state.get("last_complete")):
+                state["first_complete"] = first_done
+                state["last_complete"]  = last_done
+                state["synced_at"] = datetime.now(FINLAND_TZ).isoformat()
+                _write_state(part_root, state)
+        d += timedelta(days=1)
+
+    return written
+
+
+# ==================== QUERY ADAPTER ====================
+
+def read_items(root: str, location: str, persons, nights, time_val: str,
+               scraped_date_start: str, scraped_date_end: str,
+               checkin_start: str = None, checkin_end: str = None) -> pa.Table:
+    """
+    Rows of one partition as an Arrow table (SCHEMA plus the scraped_date
+    partition column), in scrape-date order. The scrape range prunes
+    partition directories; the check-in range is pushed down to the Parquet
+    row-group statistics.
+    """
+    part_root = partition_root(root, location, persons, nights, time_val)
+    if not os.path.isdir(part_root):
+        return READ_SCHEMA.empty_table()
+
+    dataset = ds.dataset(part_root, format="parquet", partitioning=_PARTITIONING)
+    expr = ((ds.field('scraped_date') >= scraped_date_start) &
+            (ds.field('scraped_date') <= scraped_date_end))
+    if checkin_start is not None and checkin_end is not None:
+        expr &= ((ds.field('checkin_date') >= checkin_start) &
+                 (ds.field('checkin_date') <= checkin_end))
+
+    result = dataset.to_table(filter=expr)
+    result = result.sort_by([('scraped_date', 'ascending'), ('hotel_id', 'ascending'),
+                             ('checkin_date', 'ascending'), ('checkout_date', 'ascending')])
+    return result
+
+
+def covers(root: str, location: str, persons, nights, time_val: str,
+           scraped_date_start: str, scraped_date_end: str) -> bool:
+    """True when every scrape date in the range is complete in the mirror."""
+    if not root:
+        return False
+    part_root = partition_root(root, location, persons, nights, time_val)
+    state = _read_state(part_root)
+    first = _first_complete(state)
+    return bool(first) and first <= scraped_date_start and scraped_date_end <= state["last_complete"]
+
+
+# ==================== CLI ====================
+
+def _dynamodb_table(name: str = "HotelPrices"):
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    return boto3.resource('dynamodb').Table(name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m hotel_mirror",
+                                     description="Mirror HotelPrices into a local Parquet dataset.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_sync = sub.add_parser("sync", help="incrementally sync scrape dates")
+    p_sync.add_argument("--root", required=True, help="dataset root directory")
+    p_sync.add_argument("--location", nargs="+", required=True)
+    p_sync.add_argument("--persons", nargs="+", type=int, default=DEFAULT_PERSONS)
+    p_sync.add_argument("--nights", nargs="+", type=int, default=DEFAULT_NIGHTS)
+    p_sync.add_argument("--time", nargs="+", default=DEFAULT_TIMES)
+    p_sync.add_argument("--since", help="first scrape date (YYYY-MM-DD); required on the first run")
+    p_sync.add_argument("--until", help="last scrape date (YYYY-MM-DD); default today")
+
+    p_status = sub.add_parser("status", help="show the complete scrape-date range per partition")
+    p_status.add_argument("--root", required=True)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "sync":
+        table = _dynamodb_table()
+        total = 0
+        for location in args.location:
+            for persons in args.persons:
+                for nights in args.nights:
+                    for time_val in args.time:
+                        total += sync_partition(table, args.root, location, persons, nights,
+                                                time_val, since=args.since, until=args.until)
+        print(f"Synced {total:,} rows")
+    else:
+        for dirpath, _, filenames in sorted(os.walk(args.root)):
+            if STATE_FILE in filenames:
+                state = _read_state(dirpath)
+                print(f"{os.path.relpath(dirpath, args.root)}: "
+                      f"{_first_complete(state) or '—'} .. {state.get('last_complete', '—')}")
+
+
+if __name__ == "__main__":
+    main()
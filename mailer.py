@@ -0,0 +1,274 @@
+"""
+SMTP delivery with reused, authenticated connections.
+
+Opening a connection to smtp.gmail.com costs a TCP + STARTTLS + AUTH round
+trip per message. Mailer keeps authenticated connections open and sends
+queued messages in batches over them:
+
+    mailer = Mailer("smtp.gmail.com", 587, user, password)
+    mailer.send(msg)                      # blocks until delivered, returns latency (s)
+    futures = [mailer.enqueue(m) for m in msgs]
+
+`pool_size` background threads drain the queue, each taking up to
+`batch_size` messages at a time and sending them back to back over its
+pooled connection.
+Transient failures (dropped connections, 4xx replies, socket errors) are
+retried with exponential backoff on a fresh connection; permanent ones (5xx,
+refused recipients, bad credentials) fail the message's future at once.
+
+Try it against a local debugging server:
+
+    python -m aiosmtpd -n -l localhost:1025
+    python -m mailer send-test --host localhost --port 1025 --no-starttls --to you@example.com --count 20
+"""
+import argparse
+import collections
+import logging
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import Future
+from email.message import EmailMessage
+
+log = logging.getLogger("mailer")
+
+# Connections idle longer than this are checked with NOOP before reuse
+# (Gmail drops idle sessions after a few minutes)
+IDLE_CHECK_SECONDS = 30
+
+_STOP = object()
+
+
+def _is_transient(exc: Exception) -> bool:
+    if isinstance(exc, (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused,
+                        smtplib.SMTPSenderRefused)):
+        return False
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    return isinstance(exc, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+class Mailer:
+    """Thread-safe pooled SMTP sender with a batching delivery queue."""
+
+    def __init__(self, host: str, port: int, username: str = None, password: str = None,
+                 starttls: bool = True, pool_size: int = 2, batch_size: int = 20,
+                 max_retries: int = 3, backoff: float = 1.0, timeout: float = 30.0):
+        self.host, self.port = host, port
+        self.username, self.password = username, password
+        self.starttls    = starttls
+        self.pool_size   = pool_size
+        self.batch_size  = batch_size
+        self.max_retries = max_retries
+        self.backoff     = backoff
+        self.timeout     = timeout
+
+        self._idle    = []                  # [(smtp, last_used)] ready for reuse
+        self._lock    = threading.Lock()
+        self._queue   = queue.Queue()
+        self._workers = []
+        self._latency = collections.deque(maxlen=500)
+        self.sent = self.failed = self.retries = self.connections = self.batches = 0
+
+    # ---------- connections ----------
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        with self._lock:
+            self.connections += 1
+        return smtp
+
+    def _acquire(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                smtp, last_used = self._idle.pop()
+            if time.monotonic() - last_used < IDLE_CHECK_SECONDS:
+                return smtp
+            try:
+                if smtp.noop()[0] == 250:
+                    return smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._discard(smtp)
+        return self._connect()
+
+    def _release(self, smtp: smtplib.SMTP):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append((smtp, time.monotonic()))
+                return
+        self._discard(smtp)
+
+    @staticmethod
+    def _discard(smtp: smtplib.SMTP):
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    # ---------- delivery ----------
+
+    def _deliver(self, messages: list) -> list:
+        """
+        Send [(msg, enqueued_at), ...] back to back over one connection,
+        retrying transient failures. Returns one latency (seconds from
+        enqueue to accepted by the server) or exception per message.
+        """
+        results = []
+        smtp = None
+        for msg, enqueued_at in messages:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    if smtp is None:
+                        smtp = self._acquire()
+                    smtp.send_message(msg)
+                    latency = time.perf_counter() - enqueued_at
+                    with self._lock:
+                        self.sent += 1
+                        self._latency.append(latency)
+                    results.append(latency)
+                    break
+                except Exception as e:
+                    # The session state is unknown after any failure: never reuse it
+                    if smtp is not None:
+                        self._discard(smtp)
+                        smtp = None
+                    if not _is_transient(e) or attempt == self.max_retries:
+                        log.warning("mail to %s failed after %d attempt(s): %s",
+                                    msg.get("To"), attempt + 1, e)
+                        with self._lock:
+                            self.failed += 1
+                        results.append(e)
+                        break
+                    with self._lock:
+                        self.retries += 1
+                    time.sleep(self.backoff * 2 ** attempt)
+        if smtp is not None:
+            self._release(smtp)
+        return results
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.put(_STOP)
+                    break
+                batch.append(item)
+
+            with self._lock:
+                self.batches += 1
+            try:
+                results = self._deliver([(msg, enqueued_at) for msg, enqueued_at, _ in batch])
+            except Exception as e:          # never let the worker die with futures pending
+                results = [e] * len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def enqueue(self, msg: EmailMessage) -> Future:
+        """Queue `msg` for batched delivery; the future resolves to its latency in seconds."""
+        with self._lock:
+            self._workers = [w for w in self._workers if w.is_alive()]
+            while len(self._workers) < self.pool_size:
+                worker = threading.Thread(target=self._run, name=f"mailer-{len(self._workers)}",
+                                          daemon=True)
+                worker.start()
+                self._workers.append(worker)
+        future = Future()
+        self._queue.put((msg, time.perf_counter(), future))
+        return future
+
+    def send(self, msg: EmailMessage, timeout: float = None) -> float:
+        """Deliver `msg` and return its latency in seconds. Raises the delivery error."""
+        return self.enqueue(msg).result(timeout)
+
+    def close(self):
+        """Stop the worker after the queued messages and close pooled connections."""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(_STOP)
+        for worker in workers:
+            worker.join()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            self._discard(smtp)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latency = sorted(self._latency)
+            return {
+                'sent':        self.sent,
+                'failed':      self.failed,
+                'retries':     self.retries,
+                'connections': self.connections,
+                'batches':     self.batches,
+                'queued':      self._queue.qsize(),
+                'idle':        len(self._idle),
+                'latency_p50': latency[len(latency) // 2] if latency else None,
+                'latency_p95': latency[int(len(latency) * 0.95)] if latency else None,
+            }
+
+
+# ==================== CLI ====================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mailer",
+                                     description="Send test messages through a pooled SMTP connection.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_test = sub.add_parser("send-test", help="send N small messages and report latency")
+    p_test.add_argument("--host", default="localhost")
+    p_test.add_argument("--port", type=int, default=1025)
+    p_test.add_argument("--user")
+    p_test.add_argument("--password")
+    p_test.add_argument("--no-starttls", action="store_true")
+    p_test.add_argument("--sender", default="dashboard@localhost")
+    p_test.add_argument("--to", required=True)
+    p_test.add_argument("--count", type=int, default=10)
+
+    args = parser.parse_args(argv)
+
+    mailer = Mailer(args.host, args.port, args.user, args.password, starttls=not args.no_starttls)
+    futures = []
+    for i in range(args.count):
+        msg = EmailMessage()
+        msg["Subject"] = f"Mailer test {i + 1}/{args.count}"
+        msg["From"]    = args.sender
+        msg["To"]      = args.to
+        msg.set_content("Test message from python -m mailer.")
+        futures.append(mailer.enqueue(msg))
+    for future in futures:
+        future.exception()
+    mailer.close()
+
+    stats = mailer.stats()
+    print(f"sent {stats['sent']} / failed {stats['failed']} over {stats['connections']} connection(s) "
+          f"in {stats['batches']} batch(es); p50 {stats['latency_p50'] or 0:.3f}s "
+          f"p95 {stats['latency_p95'] or 0:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
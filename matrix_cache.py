@@ -0,0 +1,124 @@
+"""
+Content-addressed disk cache for rendered price-matrix files.
+
+A matrix file is fully determined by its request (location, zone hotels,
+persons, time, start date, days forward, filter, format) and by the data
+in HotelPrices, which only grows by new scrape dates. The cache key hashes
+the request together with the newest scraped_date of the partition, so an
+identical request returns the stored bytes until a new scrape lands.
+
+    <root>/<key[:2]>/<key>.bin     the file
+    <root>/<key[:2]>/<key>.json    small metadata shown alongside it
+
+Files are written atomically. A hit touches the file's mtime, and writes
+evict the least recently used files until the cache fits its byte budget.
+"""
+import hashlib
+import json
+import os
+import threading
+
+# Bump when the layout of generated files changes so old entries are not served
+CACHE_VERSION = 1
+
+
+def fingerprint(**inputs) -> str:
+    """Stable sha256 over the request inputs (any JSON-serialisable values)."""
+    payload = json.dumps({"v": CACHE_VERSION, **inputs}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _remove_entry(bin_path: str):
+    for path in (bin_path, bin_path[:-len(".bin")] + ".json"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class MatrixArtifactCache:
+    """Thread-safe disk cache of matrix bytes with LRU eviction bounded by total file size."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root      = root
+        self.max_bytes = max_bytes
+        self._lock     = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.{ext}")
+
+    def get(self, key: str):
+        """(data, meta) for `key`, or None."""
+        path = self._path(key, "bin")
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+            with open(self._path(key, "json")) as fh:
+                meta = json.load(fh)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data, meta
+
+    def put(self, key: str, data: bytes, meta: dict = None):
+        if len(data) > self.max_bytes:
+            return
+        os.makedirs(os.path.dirname(self._path(key, "bin")), exist_ok=True)
+        # Metadata first: a .bin without its .json reads as a miss, never the reverse
+        for ext, payload in (("json", json.dumps(meta or {}).encode("utf-8")), ("bin", data)):
+            path = self._path(key, ext)
+            tmp  = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(payload)
+            os.replace(tmp, path)
+        self._evict()
+
+    def _files(self) -> list:
+        """(mtime, size, path) of every cached file, oldest first."""
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".bin"):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        info = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((info.st_mtime, info.st_size, path))
+        return sorted(files)
+
+    def _evict(self):
+        with self._lock:
+            files = self._files()
+            total = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if total <= self.max_bytes:
+                    break
+                _remove_entry(path)
+                total -= size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._files():
+                _remove_entry(path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            files = self._files()
+            total = self.hits + self.misses
+            return {
+                'entries':   len(files),
+                'bytes':     sum(size for _, size, _ in files),
+                'max_bytes': self.max_bytes,
+                'hits':      self.hits,
+                'misses':    self.misses,
+                'evictions': self.evictions,
+                'hit_rate':  self.hits / total if total else 0.0,
+            }
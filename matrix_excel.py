@@ -0,0 +1,522 @@
+"""
+Streaming Excel writer for the hotel price matrix.
+
+The workbook is built in openpyxl write-only mode: every sheet is streamed
+row by row to a temporary file instead of being held as a grid of Cell
+objects, and cells refer to a handful of shared named styles instead of
+carrying their own Font / Alignment / Border instances.
+
+Layout per sheet:
+
+    URL | Name | Review Score | City | Distance | Breakfast Included | Free Cancellation | dd/mm/YYYY ...
+
+one row per hotel × breakfast × cancellation variant, grouped by persons
+(and scrape time when the frame has a `time` column), with prices taken
+from a prebuilt (rows × check-in dates) array. When a matrix holds several
+groups each block starts with a label row such as "2 Persons · Morning".
+export_matrix also renders the same matrix unstyled or as csv.gz / parquet.
+"""
+import io
+import os
+import pickle
+import queue
+import re
+import subprocess
+import sys
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, Side
+from openpyxl.utils import get_column_letter
+
+META_COLS = ["URL", "Name", "Review Score", "City", "Distance",
+             "Breakfast Included", "Free Cancellation"]
+META_WIDTHS = [45, 38, 12, 14, 22, 18, 18]
+DATE_WIDTH  = 12
+HEADER_HEIGHT = 28
+
+# (sheet title, breakfast_included, free_cancellation) for the all-data mode
+FILTERS = [
+    ("No Extras",          False, False),
+    ("Free Cancellation",  False, True),
+    ("Breakfast Included", True,  False),
+    ("Breakfast + Cancel", True,  True),
+]
+
+_META_FIELDS = ["hotel_url", "review_score", "city", "distance",
+                "breakfast_included", "free_cancellation"]
+
+
+# ==================== STYLES ====================
+
+def _named_styles() -> list:
+    thin   = Side(style="thin", color="CCCCCC")
+    brd    = Border(left=thin, right=thin, top=thin, bottom=thin)
+    center = Alignment(horizontal="center", vertical="center", wrap_text=True)
+    left   = Alignment(horizontal="left", vertical="center")
+
+    data_font = Font(name="Arial", size=9)
+    return [
+        NamedStyle(name="mx_header", font=Font(bold=True, color="000000", name="Arial", size=9),
+                   alignment=center, border=brd),
+        NamedStyle(name="mx_hotel",  font=Font(bold=True, name="Arial", size=9),
+                   alignment=left, border=brd),
+        NamedStyle(name="mx_url",    font=Font(name="Arial", size=9, color="0563C1", underline="single"),
+                   alignment=left, border=brd),
+        NamedStyle(name="mx_left",   font=data_font, alignment=left, border=brd),
+        NamedStyle(name="mx_center", font=data_font, alignment=center, border=brd),
+        NamedStyle(name="mx_price",  font=data_font, alignment=center, border=brd,
+                   number_format="0.0"),
+        NamedStyle(name="mx_note",   font=data_font),
+    ]
+
+
+def _new_workbook():
+    wb = openpyxl.Workbook(write_only=True)
+    styles = _named_styles()
+    for style in styles:
+        wb.add_named_style(style)
+    return wb, styles
+
+
+def _style_arrays(ws, styles: list) -> dict:
+    """
+    Resolve every named style once per sheet. Cells then share the resolved
+    style array instead of looking the name up again for each of them.
+    Registering them here, before any row is written, also fixes their cell
+    style ids in `styles` order, so sheets rendered in separate workbooks
+    can be spliced into one package (see _assemble).
+    """
+    arrays = {}
+    for style in styles:
+        cell = WriteOnlyCell(ws)
+        cell.style = style.name
+        cell.style_id
+        arrays[style.name] = cell._style
+    return arrays
+
+
+def _cell(ws, value, style_array) -> WriteOnlyCell:
+    cell = WriteOnlyCell(ws, value=value)
+    cell._style = style_array
+    return cell
+
+
+# ==================== DATA PREP ====================
+
+def _row_ids(df: pd.DataFrame) -> pd.Series:
+    return (
+        df["name"].astype(str) + " | " +
+        df["breakfast_included"].astype(str) + " | " +
+        df["free_cancellation"].astype(str)
+    )
+
+
+def _group_label(persons, time_val) -> str:
+    label = f"{persons} Person{'s' if persons > 1 else ''}"
+    return f"{label} · {time_val.title()}" if time_val else label
+
+
+def _round_1dp(values: np.ndarray) -> np.ndarray:
+    """
+    round(v, 1) for every element, ties decided on the exact binary value like
+    Python's round(). np.round scales by 10 first, which can land on a false
+    tie (232.95 is 232.9499… but 232.95 * 10 == 2329.5 rounds up to 233.0).
+    """
+    a, b   = values * 8, values * 2              # exact: power-of-two scaling
+    scaled = a + b                               # values * 10, rounded once
+    b_part = scaled - a
+    error  = (a - (scaled - b_part)) + (b - b_part)   # values * 10 == scaled + error exactly
+    nearest = np.rint(scaled)
+    tie     = np.abs(scaled - nearest) == 0.5
+    nearest = np.where(tie & (error > 0), scaled + 0.5, np.where(tie & (error < 0), scaled - 0.5, nearest))
+    return nearest / 10
+
+
+def prepare_matrix(df: pd.DataFrame, persons_list: list) -> dict:
+    """
+    Lay the whole matrix out once as plain arrays.
+
+    Rows are (persons, time, row_id) keys for the persons in `persons_list`,
+    ordered by persons, time (category order when `time` is categorical)
+    then row_id; meta values come from each key's first row in `df`. Frames
+    without a `time` column form one time group. Returns a dict of
+        dates    sorted check-in dates (the date columns)
+        headers  sheet header labels
+        persons, breakfast, free_cancel   per-row arrays (sheet selection)
+        times    per-row scrape time, None without a `time` column
+        meta     per-row lists: url, name, review, city, distance, breakfast_str,
+                 free_cancel_str, and group (block label, None for single-group matrices)
+        prices   per-row lists of 1-decimal prices, None where there is no price
+        grid     the same prices as a float array, NaN where there is no price
+    """
+    df = df[df["persons"].isin(persons_list)]
+    dates = np.sort(df["checkin_date"].unique())
+
+    if "time" in df.columns:
+        time_rank = df["time"].astype("category").cat.codes.to_numpy()
+    else:
+        time_rank = np.zeros(len(df), dtype="int8")
+    keys  = pd.DataFrame({"persons": df["persons"].to_numpy(), "time": time_rank,
+                          "row_id": _row_ids(df).to_numpy()})
+    first = keys.drop_duplicates().sort_values(["persons", "time", "row_id"], kind="stable")
+    row_of = pd.MultiIndex.from_frame(first).get_indexer(pd.MultiIndex.from_frame(keys))
+    col_of = np.searchsorted(dates, df["checkin_date"].to_numpy())
+
+    # First non-missing price per (row, date), like pivot_table(aggfunc="first")
+    price = df["price"].to_numpy(dtype="float64")
+    ok    = ~np.isnan(price)
+    flat  = row_of[ok] * len(dates) + col_of[ok]
+    cells, first_hit = np.unique(flat, return_index=True)
+    grid = np.full(len(first) * len(dates), np.nan)
+    grid[cells] = price[ok][first_hit]
+    grid = _round_1dp(grid.reshape(len(first), len(dates)))
+    prices = np.where(np.isnan(grid), None, grid).tolist()
+
+    meta_df = df.iloc[first.index.to_numpy()]
+    review  = np.round(pd.to_numeric(meta_df["review_score"], errors="coerce").to_numpy(dtype="float64"), 2)
+    breakfast   = meta_df["breakfast_included"].to_numpy(dtype=bool)
+    free_cancel = meta_df["free_cancellation"].to_numpy(dtype=bool)
+    row_persons = first["persons"].to_numpy()
+    row_times   = meta_df["time"].astype(str).tolist() if "time" in df.columns else [None] * len(first)
+
+    groups = [_group_label(p, t) for p, t in zip(row_persons.tolist(), row_times)]
+    if len(set(groups)) < 2:
+        groups = [None] * len(groups)
+
+    return {
+        "dates":       dates,
+        "headers":     META_COLS + [pd.Timestamp(d).strftime("%d/%m/%Y") for d in dates],
+        "persons":     row_persons,
+        "times":       row_times,
+        "breakfast":   breakfast,
+        "free_cancel": free_cancel,
+        "meta": {
+            "url":             meta_df["hotel_url"].astype(str).tolist(),
+            "name":            meta_df["name"].astype(str).tolist(),
+            "review":          [float(v) if v and not np.isnan(v) else "" for v in review],
+            "city":            meta_df["city"].tolist(),
+            "distance":        meta_df["distance"].tolist(),
+            "breakfast_str":   [str(v) for v in breakfast],
+            "free_cancel_str": [str(v) for v in free_cancel],
+            "group":           groups,
+        },
+        "prices":      prices,
+        "grid":        grid,
+    }
+
+
+# ==================== WRITER ====================
+
+def _write_sheet(wb, title: str, matrix: dict, rows, styles: list):
+    """Append one sheet holding the matrix rows at indices `rows` (in order)."""
+    ws = wb.create_sheet(title=title)
+    s  = _style_arrays(ws, styles)
+    headers = matrix["headers"]
+
+    for ci, w in enumerate(META_WIDTHS, start=1):
+        ws.column_dimensions[get_column_letter(ci)].width = w
+    for ci in range(len(META_COLS) + 1, len(headers) + 1):
+        ws.column_dimensions[get_column_letter(ci)].width = DATE_WIDTH
+    ws.row_dimensions[1].height = HEADER_HEIGHT
+    ws.freeze_panes = f"{get_column_letter(len(META_COLS) + 1)}2"
+
+    ws.append([_cell(ws, label, s["mx_header"]) for label in headers])
+
+    if not len(rows):
+        ws.append([_cell(ws, "No data for this filter combination.", s["mx_note"])])
+        return
+
+    meta   = matrix["meta"]
+    prices = matrix["prices"]
+    empty, price_style = s["mx_center"], s["mx_price"]
+    group = None
+    for k in rows:
+        if meta["group"][k] != group:
+            group = meta["group"][k]
+            ws.append([_cell(ws, group, s["mx_hotel"])])
+        url = meta["url"][k]
+        url_cell = _cell(ws, url, s["mx_url"] if url else s["mx_left"])
+        if url:
+            url_cell.hyperlink = url
+
+        row = [
+            url_cell,
+            _cell(ws, meta["name"][k], s["mx_hotel"]),
+            _cell(ws, meta["review"][k], s["mx_center"]),
+            _cell(ws, meta["city"][k], s["mx_left"]),
+            _cell(ws, meta["distance"][k], s["mx_left"]),
+            _cell(ws, meta["breakfast_str"][k], s["mx_center"]),
+            _cell(ws, meta["free_cancel_str"][k], s["mx_center"]),
+        ]
+        row.extend(_cell(ws, "", empty) if val is None else _cell(ws, val, price_style)
+                   for val in prices[k])
+        ws.append(row)
+
+
+def _sheet_rows(matrix: dict, single_sheet: str = None) -> list:
+    """(sheet title, matrix row indices) for each sheet of the export."""
+    if single_sheet:
+        return [(single_sheet, np.arange(len(matrix["persons"])))]
+    return [(label, np.flatnonzero((matrix["breakfast"] == bf) & (matrix["free_cancel"] == fc_flag)))
+            for label, bf, fc_flag in FILTERS]
+
+
+# ==================== PARALLEL SHEETS ====================
+# In all-data mode the four sheets are rendered by persistent worker
+# processes. Each worker writes its sheet into a one-sheet workbook with
+# identical named styles; the sheet parts are then swapped into a skeleton
+# workbook holding the shared styles, sheet names and content types.
+#
+# Workers are plain `python -m matrix_sheet_worker` subprocesses fed pickled
+# jobs over their pipes. multiprocessing's spawn and forkserver children would
+# first re-run the parent's __main__ — under Streamlit, the dashboard script.
+
+SHEET_WORKERS = min(4, len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity")
+                    else os.cpu_count() or 1)
+
+# Below this many cells the pool round trip costs more than it saves
+PARALLEL_MIN_CELLS = 50_000
+
+_SHEET_PART = re.compile(r"xl/worksheets/sheet(\d+)\.xml")
+
+_idle_workers = queue.Queue()   # idle _SheetWorker, or None for a slot whose worker is not running
+_dispatch     = None
+_pool_lock    = threading.Lock()
+
+
+class SheetWorkerError(RuntimeError):
+    """A sheet worker process died or broke its pipe protocol."""
+
+
+class _SheetWorker:
+    """One worker process; jobs and (ok, result) replies travel as pickles over its stdin/stdout."""
+
+    def __init__(self):
+        try:
+            self.proc = subprocess.Popen([sys.executable, "-m", "matrix_sheet_worker"],
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        except OSError as e:
+            raise SheetWorkerError(f"could not start a sheet worker: {e}") from e
+
+    def render(self, job: dict) -> tuple:
+        try:
+            pickle.dump(job, self.proc.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+            self.proc.stdin.flush()
+            ok, result = pickle.load(self.proc.stdout)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            self.proc.kill()
+            raise SheetWorkerError(f"sheet worker exited ({self.proc.wait()})") from e
+        if not ok:
+            raise result
+        return result
+
+
+def _render_on_worker(job: dict) -> tuple:
+    """Dispatch-thread task: render one sheet on an idle worker, starting one for an empty slot."""
+    worker = _idle_workers.get()
+    try:
+        worker = worker or _SheetWorker()
+        return worker.render(job)
+    except SheetWorkerError:
+        worker = None     # the slot starts a fresh worker on its next job
+        raise
+    finally:
+        _idle_workers.put(worker)
+
+
+def _render_in_pool(jobs: list) -> list:
+    """Run _render_sheet over `jobs` on the shared workers, one dispatch thread per worker."""
+    global _dispatch
+    with _pool_lock:
+        if _dispatch is None:
+            for _ in range(SHEET_WORKERS):
+                _idle_workers.put(None)
+            _dispatch = ThreadPoolExecutor(max_workers=SHEET_WORKERS, thread_name_prefix="matrix-sheet")
+    return list(_dispatch.map(_render_on_worker, jobs))
+
+
+def _sheet_job(title: str, matrix: dict, rows) -> dict:
+    """Just the rows one sheet needs, so only those are pickled to the worker."""
+    return {
+        "title":  title,
+        "matrix": {
+            "headers": matrix["headers"],
+            "meta":    {k: [v[i] for i in rows] for k, v in matrix["meta"].items()},
+            "prices":  [matrix["prices"][i] for i in rows],
+        },
+    }
+
+
+def _render_sheet(job: dict) -> tuple:
+    """Process-pool task: render one sheet. Returns (sheet xml, hyperlink rels xml or None)."""
+    wb, styles = _new_workbook()
+    _write_sheet(wb, job["title"], job["matrix"], range(len(job["matrix"]["prices"])), styles)
+    buf = io.BytesIO()
+    wb.save(buf)
+    with zipfile.ZipFile(buf) as package:
+        rels = "xl/worksheets/_rels/sheet1.xml.rels"
+        return (package.read("xl/worksheets/sheet1.xml"),
+                package.read(rels) if rels in package.namelist() else None)
+
+
+def _assemble(titles: list, sheets: list) -> bytes:
+    """Build the skeleton workbook and swap the rendered sheet parts into it."""
+    wb, styles = _new_workbook()
+    for title in titles:
+        _style_arrays(wb.create_sheet(title=title), styles)
+    skeleton = io.BytesIO()
+    wb.save(skeleton)
+
+    out = io.BytesIO()
+    with zipfile.ZipFile(skeleton) as src, zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            part = _SHEET_PART.fullmatch(info.filename)
+            dst.writestr(info, sheets[int(part.group(1)) - 1][0] if part else src.read(info))
+        for i, (_, rels) in enumerate(sheets, start=1):
+            if rels is not None:
+                dst.writestr(f"xl/worksheets/_rels/sheet{i}.xml.rels", rels)
+    return out.getvalue()
+
+
+def build_matrix_xlsx(df: pd.DataFrame, persons_list: list, single_sheet: str = None,
+                      parallel: bool = None) -> bytes:
+    """
+    Render the price matrix workbook. `df` needs name, price, checkin_date,
+    persons and the meta columns. With `single_sheet` the (already filtered)
+    data goes to one sheet of that name; otherwise it is split into the four
+    breakfast/cancellation sheets of FILTERS, whose row masks are computed
+    once from the prepared matrix. `parallel` renders those sheets on the
+    sheet workers; by default it does so for matrices of PARALLEL_MIN_CELLS
+    cells or more.
+    """
+    matrix = prepare_matrix(df, persons_list)
+    sheets = _sheet_rows(matrix, single_sheet)
+
+    if parallel is None:
+        parallel = (SHEET_WORKERS > 1 and
+                    len(matrix["prices"]) * len(matrix["dates"]) >= PARALLEL_MIN_CELLS)
+    if parallel and len(sheets) > 1:
+        jobs = [_sheet_job(title, matrix, rows) for title, rows in sheets]
+        try:
+            return _assemble([title for title, _ in sheets], _render_in_pool(jobs))
+        except SheetWorkerError:
+            pass                  # fall through to the in-process build
+
+    wb, styles = _new_workbook()
+    for title, rows in sheets:
+        _write_sheet(wb, title, matrix, rows, styles)
+
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+# ==================== COMPACT FORMATS ====================
+# The styled workbook is meant for reading; consumers that load the matrix
+# into their own tools only need the values. xlsx-lite keeps the sheet
+# layout without styles, widths or hyperlinks. csv.gz holds all sheets in
+# one wide table (a Sheet column, then one column per ISO check-in date);
+# parquet holds the same data in long form, one row per priced cell, which
+# is both what dataframe tools expect and far smaller than 365 sparse
+# float columns.
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# format key -> (label, file extension, MIME type)
+EXPORT_FORMATS = {
+    "xlsx":      ("Excel, styled",      "xlsx",    XLSX_MIME),
+    "xlsx-lite": ("Excel, plain",       "xlsx",    XLSX_MIME),
+    "csv.gz":    ("CSV, gzip",          "csv.gz",  "application/gzip"),
+    "parquet":   ("Parquet",            "parquet", "application/vnd.apache.parquet"),
+}
+
+
+def build_matrix_xlsx_lite(df: pd.DataFrame, persons_list: list, single_sheet: str = None) -> bytes:
+    """Same sheets and cells as build_matrix_xlsx, without any styling."""
+    matrix = prepare_matrix(df, persons_list)
+    meta   = matrix["meta"]
+    wb = openpyxl.Workbook(write_only=True)
+    for title, rows in _sheet_rows(matrix, single_sheet):
+        ws = wb.create_sheet(title=title)
+        ws.append(matrix["headers"])
+        if not len(rows):
+            ws.append(["No data for this filter combination."])
+        group = None
+        for k in rows:
+            if meta["group"][k] != group:
+                group = meta["group"][k]
+                ws.append([group])
+            ws.append([meta["url"][k], meta["name"][k], meta["review"][k], meta["city"][k],
+                       meta["distance"][k], meta["breakfast_str"][k], meta["free_cancel_str"][k]]
+                      + matrix["prices"][k])
+
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def matrix_frame(df: pd.DataFrame, persons_list: list, single_sheet: str = None) -> pd.DataFrame:
+    """
+    The matrix as one flat table: Sheet, Persons, Time, the meta columns and
+    one float column per check-in date (YYYY-MM-DD), NaN where there is no price.
+    """
+    matrix = prepare_matrix(df, persons_list)
+    meta   = matrix["meta"]
+    full = pd.concat([
+        pd.DataFrame({
+            "Persons":            matrix["persons"],
+            "Time":               matrix["times"],
+            "URL":                meta["url"],
+            "Name":               meta["name"],
+            "Review Score":       pd.to_numeric(pd.Series(meta["review"], dtype=object), errors="coerce"),
+            "City":               meta["city"],
+            "Distance":           meta["distance"],
+            "Breakfast Included": matrix["breakfast"],
+            "Free Cancellation":  matrix["free_cancel"],
+        }),
+        pd.DataFrame(matrix["grid"],
+                     columns=[pd.Timestamp(d).strftime("%Y-%m-%d") for d in matrix["dates"]]),
+    ], axis=1)
+
+    sheets = _sheet_rows(matrix, single_sheet)
+    table  = pd.concat([full.iloc[rows] for _, rows in sheets], ignore_index=True)
+    table.insert(0, "Sheet", np.repeat([title for title, _ in sheets], [len(rows) for _, rows in sheets]))
+    return table
+
+
+def _long_form(table: pd.DataFrame) -> pd.DataFrame:
+    """Wide matrix_frame -> one row per priced cell with Check-in and Price columns."""
+    id_cols   = ["Sheet", "Persons", "Time"] + META_COLS
+    date_cols = [c for c in table.columns if c not in id_cols]
+    prices    = table[date_cols].to_numpy(dtype="float64")
+    r, c = np.nonzero(~np.isnan(prices))
+    long = table[id_cols].iloc[r].reset_index(drop=True)
+    long["Check-in"] = pd.to_datetime(np.asarray(date_cols, dtype=object)[c], format="%Y-%m-%d")
+    long["Price"]    = prices[r, c]
+    return long
+
+
+def export_matrix(df: pd.DataFrame, persons_list: list, fmt: str = "xlsx",
+                  single_sheet: str = None) -> bytes:
+    """Render the matrix in one of EXPORT_FORMATS."""
+    if fmt == "xlsx":
+        return build_matrix_xlsx(df, persons_list, single_sheet=single_sheet)
+    if fmt == "xlsx-lite":
+        return build_matrix_xlsx_lite(df, persons_list, single_sheet=single_sheet)
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown matrix export format: {fmt}")
+
+    table = matrix_frame(df, persons_list, single_sheet=single_sheet)
+    buf = io.BytesIO()
+    if fmt == "csv.gz":
+        table.to_csv(buf, index=False, compression={"method": "gzip", "mtime": 0})
+    else:
+        _long_form(table).to_parquet(buf, index=False, compression="zstd")
+    return buf.getvalue()
@@ -0,0 +1,734 @@
+"""
+Price-matrix pipeline without Streamlit.
+
+HotelPrices access (per-thread boto3 tables, the bounded query pool, the
+access-path planner, the local Parquet mirror), the typed price frames and
+the query → build → email steps of a matrix run live here, so the
+dashboard's "Generate & Send" jobs and the scheduled automations run the
+same code:
+
+    python -m matrix_pipeline run-automation <automation_id>
+    python -m matrix_pipeline run-automation <automation_id> --no-send --no-cache --out matrix.xlsx
+
+The second form is a local benchmark: it queries and builds the matrix,
+prints the time spent in each step and writes the file instead of mailing
+it. `lambda_handler` runs the same thing for the EventBridge schedules,
+whose input is {"automation_id": ...}.
+
+Configuration comes from the environment (a .env file is read when
+python-dotenv is installed): AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY,
+AWS_DEFAULT_REGION, GMAIL_SENDER, GMAIL_APP_PASSWORD and optionally
+HOTEL_MIRROR_DIR and MATRIX_CACHE_DIR.
+"""
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+import boto3
+import pandas as pd
+import pyarrow as pa
+import pytz
+from boto3.dynamodb.conditions import Attr, Key
+
+import hotel_mirror
+import mailer
+import matrix_cache
+import matrix_excel
+
+log = logging.getLogger("matrix_pipeline")
+
+FINLAND_TZ = pytz.timezone('Europe/Helsinki')
+
+# Upper bound on concurrent DynamoDB queries issued by one fan-out (calendar dates etc.)
+QUERY_POOL_WORKERS = 8
+
+# Upper bound on waiting for a queued email, retries and backoff included
+MAIL_SEND_TIMEOUT = 120
+
+# Size cap of the matrix file cache; least recently used files are evicted beyond it
+MATRIX_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+
+# ==================== PRICE FRAMES ====================
+# Repeated string columns are stored as categoricals; dates as datetime64.
+# Prices and scores stay float64: float32 shifts 1-decimal rounding (118.95 -> 118.9).
+PRICE_FRAME_CATEGORIES = ['name', 'location', 'time', 'city', 'distance', 'hotel_url']
+
+
+def items_to_frame(items) -> pd.DataFrame:
+    """
+    Build the typed columnar frame used by the dashboards straight from raw
+    HotelPrices items — a list of DynamoDB item dicts, or the Arrow table of
+    a mirror read. Prices become floats (NaN when unparseable), check-in and
+    scrape dates datetime64.
+    """
+    if isinstance(items, pa.Table):
+        return _arrow_to_frame(items)
+
+    def col(key, default):
+        return [item.get(key, default) for item in items]
+
+    def dates(key):
+        return pd.to_datetime(pd.Series(col(key, ''), dtype=object), format='%Y-%m-%d', errors='coerce')
+
+    def numbers(key, default):
+        return pd.to_numeric(pd.Series(col(key, default), dtype=object), errors='coerce')
+
+    return pd.DataFrame({
+        'name':               pd.Categorical(col('hotel_name', '')),
+        'price':              numbers('price', 0).astype('float64'),
+        'price_date':         dates('checkin_date'),
+        'scrape_date':        dates('scraped_date'),
+        'location':           pd.Categorical(col('location', '')),
+        'persons':            numbers('persons', 0).fillna(0).astype('int16'),
+        'nights':             numbers('nights', 0).fillna(0).astype('int16'),
+        'time':               pd.Categorical(col('time', '')),
+        'review_score':       numbers('review_score', 0).astype('float64'),
+        'city':               pd.Categorical(col('city', '')),
+        'distance':           pd.Categorical(col('distance', '')),
+        'hotel_url':          pd.Categorical(col('hotel_url', '')),
+        'breakfast_included': pd.Series(col('breakfast_included', False), dtype=bool),
+        'free_cancellation':  pd.Series(col('free_cancellation', False), dtype=bool),
+    })
+
+
+# Mirror column -> price frame column, for the columns whose names differ
+_MIRROR_COLUMNS = {'hotel_name': 'name', 'checkin_date': 'price_date', 'scraped_date': 'scrape_date'}
+
+
+def _arrow_to_frame(table: pa.Table) -> pd.DataFrame:
+    """items_to_frame for a hotel_mirror.read_items table, without going through row dicts."""
+    table = table.rename_columns([_MIRROR_COLUMNS.get(n, n) for n in table.column_names])
+    df = table.to_pandas(categories=PRICE_FRAME_CATEGORIES)
+    for column in PRICE_FRAME_CATEGORIES:
+        # Arrow keeps first-seen order; pd.Categorical (the item path) sorts
+        df[column] = df[column].cat.reorder_categories(sorted(df[column].cat.categories))
+
+    def dates(column):
+        return pd.to_datetime(df[column], format='%Y-%m-%d', errors='coerce')
+
+    return pd.DataFrame({
+        'name':               df['name'],
+        'price':              df['price'].astype('float64'),
+        'price_date':         dates('price_date'),
+        'scrape_date':        dates('scrape_date'),
+        'location':           df['location'],
+        'persons':            df['persons'].fillna(0).astype('int16'),
+        'nights':             df['nights'].fillna(0).astype('int16'),
+        'time':               df['time'],
+        'review_score':       df['review_score'].astype('float64'),
+        'city':               df['city'],
+        'distance':           df['distance'],
+        'hotel_url':          df['hotel_url'],
+        'breakfast_included': df['breakfast_included'].fillna(False).astype(bool),
+        'free_cancellation':  df['free_cancellation'].fillna(False).astype(bool),
+    })
+
+
+def concat_price_frames(frames: list) -> pd.DataFrame:
+    """pd.concat for price frames; categoricals with differing categories are re-encoded."""
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return items_to_frame([])
+    df = pd.concat(frames, ignore_index=True)
+    for column in PRICE_FRAME_CATEGORIES:
+        if not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    return df
+
+
+def scrape_dates(scraped_date_start: str, scraped_date_end: str) -> list:
+    """Every 'YYYY-MM-DD' from start to end, inclusive."""
+    d   = datetime.strptime(scraped_date_start, "%Y-%m-%d")
+    end = datetime.strptime(scraped_date_end, "%Y-%m-%d")
+    dates = []
+    while d <= end:
+        dates.append(d.strftime("%Y-%m-%d"))
+        d += timedelta(days=1)
+    return dates
+
+
+# ==================== ACCESS-PATH PLANNER ====================
+# A HotelPrices request is a (scrape range x check-in range) rectangle inside
+# one partition, and there are three ways to read it:
+#   base       - one base-table key range over the scrape dates. Every check-in
+#                of those scrapes is read and billed; a FilterExpression trims.
+#   gsi_range  - one GSI key range over the check-in dates. Every scrape of
+#                those check-ins is read and billed; a FilterExpression trims.
+#   gsi_fanout - one exact GSI key range per check-in date. Reads only the
+#                rectangle, at the cost of one request per check-in date.
+# Costs are estimated in (scrape date, check-in date) cells; every cell holds
+# roughly the same hotels x variants rows, so cells compare across paths.
+
+PRICE_INDEX_NAME = 'hotel_prices_by_checkin_scraped'
+
+# Check-in dates covered by a single scrape
+SCRAPE_HORIZON_DAYS = 365
+
+# Round-trip cost of one extra query in the fan-out, expressed in cells
+FANOUT_QUERY_OVERHEAD_CELLS = 10
+
+
+def _days_inclusive(start: str, end: str) -> int:
+    return (datetime.strptime(end, "%Y-%m-%d") - datetime.strptime(start, "%Y-%m-%d")).days + 1
+
+
+def plan_price_query(partition_key, scraped_start, scraped_end,
+                     checkin_start=None, checkin_end=None) -> dict:
+    """
+    Pick the cheapest access path for one partition.
+    Returns {'path', 'estimate', 'requests'} where each request is a dict of
+    table.query kwargs; without a check-in range only the base table applies.
+    """
+    pk_cond = Key('location#persons#nights#time').eq(partition_key)
+    base_request = {
+        'KeyConditionExpression': pk_cond &
+            Key('scraped_date#hotel_id#checkin_date#checkout_date')
+                .between(f"{scraped_start}#", f"{scraped_end}~")
+    }
+    if checkin_start is None or checkin_end is None:
+        return {'path': 'base', 'estimate': None, 'requests': [base_request]}
+    base_request['FilterExpression'] = Attr('checkin_date').between(checkin_start, checkin_end)
+
+    n_scrapes  = _days_inclusive(scraped_start, scraped_end)
+    n_checkins = _days_inclusive(checkin_start, checkin_end)
+    estimate = {
+        'base':       n_scrapes * SCRAPE_HORIZON_DAYS,
+        'gsi_range':  n_checkins * SCRAPE_HORIZON_DAYS,
+        'gsi_fanout': n_checkins * (n_scrapes + FANOUT_QUERY_OVERHEAD_CELLS),
+    }
+    path = min(estimate, key=estimate.get)
+
+    if path == 'base':
+        requests = [base_request]
+    elif path == 'gsi_range':
+        requests = [{
+            'IndexName': PRICE_INDEX_NAME,
+            'KeyConditionExpression': pk_cond &
+                Key('checkin_date#scraped_date')
+                    .between(f"{checkin_start}#{scraped_start}", f"{checkin_end}#{scraped_end}~"),
+            'FilterExpression': Attr('scraped_date').between(scraped_start, scraped_end),
+        }]
+    else:
+        requests = [
+            {
+                'IndexName': PRICE_INDEX_NAME,
+                'KeyConditionExpression': pk_cond &
+                    Key('checkin_date#scraped_date')
+                        .between(f"{checkin}#{scraped_start}", f"{checkin}#{scraped_end}~"),
+            }
+            for checkin in scrape_dates(checkin_start, checkin_end)
+        ]
+
+    return {'path': path, 'estimate': estimate[path], 'requests': requests}
+
+
+def log_price_plan(label: str, plan: dict, n_items: int, capacity: float):
+    log.info("%s: plan=%s requests=%d est_cells=%s items=%d consumed_rcu=%.1f",
+             label, plan['path'], len(plan['requests']), plan['estimate'], n_items, capacity)
+
+
+def filter_desc_from_flags(breakfast: bool, free_cancel: bool) -> str:
+    """Return a consistent filter description string."""
+    if breakfast and free_cancel:
+        return "Breakfast_FreeCancel"
+    elif breakfast:
+        return "Breakfast"
+    elif free_cancel:
+        return "FreeCancel"
+    else:
+        return "NoExtras"
+
+
+# ==================== PRICE STORE ====================
+
+class PriceStore:
+    """
+    HotelPrices access for one process: per-thread Table handles, a bounded
+    pool for parallel DynamoDB reads and the optional local Parquet mirror.
+    Credentials left as None fall back to boto3's usual lookup.
+    """
+
+    def __init__(self, aws_access_key_id: str = None, aws_secret_access_key: str = None,
+                 region_name: str = None, mirror_dir: str = "",
+                 query_workers: int = QUERY_POOL_WORKERS, price_table: str = "HotelPrices"):
+        self._credentials = {
+            'aws_access_key_id':     aws_access_key_id,
+            'aws_secret_access_key': aws_secret_access_key,
+            'region_name':           region_name,
+        }
+        self.mirror_dir  = mirror_dir
+        self.price_table = price_table
+        self.pool        = ThreadPoolExecutor(max_workers=query_workers, thread_name_prefix="ddb-query")
+        self._local      = threading.local()
+
+    def table(self, table_name: str):
+        """
+        Per-thread Table handle.
+        boto3 resources are not thread-safe, so each thread builds its own
+        session once and reuses it for every task it picks up.
+        """
+        resource = getattr(self._local, 'dynamodb', None)
+        if resource is None:
+            resource = boto3.session.Session(**self._credentials).resource('dynamodb')
+            self._local.dynamodb = resource
+        return resource.Table(table_name)
+
+    def _pump_pages(self, table_name: str, operation: str, request: dict, tag, out: queue.Queue,
+                    stop: threading.Event):
+        """
+        Pool task: run one query/scan request to exhaustion (or until `stop` is
+        set) and put every page on `out` as it arrives as (tag, items, consumed
+        RCU), then (tag, None, 0.0) when done. An exception is put in place of
+        the items.
+        """
+        try:
+            call   = getattr(self.table(table_name), operation)
+            kwargs = dict(request, ReturnConsumedCapacity='TOTAL')
+            while True:
+                response = call(**kwargs)
+                out.put((tag, response.get('Items', []),
+                         response.get('ConsumedCapacity', {}).get('CapacityUnits', 0.0)))
+                if 'LastEvaluatedKey' not in response or stop.is_set():
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            out.put((tag, e, 0.0))
+            return
+        out.put((tag, None, 0.0))
+
+    def iter_pages(self, table_name: str, operation: str, jobs: list):
+        """
+        Run [(tag, request), ...] against `table_name` on the pool and yield
+        (tag, items, RCU) per page in arrival order; items is None once a
+        request has finished. Raises the first DynamoDB error. Closing the
+        generator early stops every request after its current page.
+        """
+        out  = queue.Queue()
+        stop = threading.Event()
+        for tag, request in jobs:
+            self.pool.submit(self._pump_pages, table_name, operation, request, tag, out, stop)
+        pending = len(jobs)
+        try:
+            while pending:
+                tag, items, capacity = out.get()
+                if isinstance(items, Exception):
+                    raise items
+                if items is None:
+                    pending -= 1
+                yield tag, items, capacity
+        finally:
+            stop.set()
+
+    def mirror_items(self, location, persons, nights, time_val, scraped_date_start, scraped_date_end,
+                     checkin_start=None, checkin_end=None):
+        """
+        HotelPrices rows from the local Parquet mirror as an Arrow table (which
+        items_to_frame takes as is), or None when the mirror is disabled or
+        does not hold every scrape date in the range — the caller then falls
+        back to DynamoDB.
+        """
+        if not self.mirror_dir or not hotel_mirror.covers(
+                self.mirror_dir, location, persons, nights, time_val,
+                scraped_date_start, scraped_date_end):
+            return None
+        try:
+            return hotel_mirror.read_items(self.mirror_dir, location, persons, nights, time_val,
+                                           scraped_date_start, scraped_date_end,
+                                           checkin_start, checkin_end)
+        except Exception:
+            return None
+
+    def query_matrix_data(self, location: str, persons_list: list, times: list,
+                          start_date, days_forward: int, progress=None) -> pd.DataFrame:
+        """
+        Query HotelPrices for every persons × time combo of one matrix run.
+        - scrape_date = start_date (same day the user picks)
+        - checkin window = start_date → start_date + days_forward - 1
+        - nights = 1
+        - No breakfast/cancellation filter — returns all rows as a typed frame
+          with `persons` and a `time` categorical ordered like `times`
+        Combos are planned here and their requests then run together on the
+        query pool, so N combos cost about as long as the slowest one.
+        `progress(persons, time_val, n_rows)` is called as each combo completes.
+        Raises RuntimeError on DynamoDB errors.
+        """
+        scraped_date_str = start_date.strftime("%Y-%m-%d")
+
+        end_date      = start_date + timedelta(days=days_forward - 1)
+        checkin_start = start_date.strftime("%Y-%m-%d")
+        checkin_end   = end_date.strftime("%Y-%m-%d")
+
+        combos = [(persons, time_val) for persons in persons_list for time_val in times]
+        items  = {}
+        plans  = {}
+        for combo in combos:
+            persons, time_val = combo
+            mirrored = self.mirror_items(location, persons, 1, time_val, scraped_date_str,
+                                         scraped_date_str, checkin_start, checkin_end)
+            if mirrored is not None:
+                items[combo] = mirrored
+            else:
+                pk = f"{location}#{persons}#1#{time_val}"
+                plans[combo] = plan_price_query(pk, scraped_date_str, scraped_date_str,
+                                                checkin_start, checkin_end)
+        if progress:
+            for (persons, time_val), combo_items in items.items():
+                progress(persons, time_val, len(combo_items))
+
+        # Every combo's requests in one fan-out; tags route pages back to their combo
+        jobs = [((combo, i), request)
+                for combo, plan in plans.items() for i, request in enumerate(plan['requests'])]
+        pending  = {combo: len(plan['requests']) for combo, plan in plans.items()}
+        capacity = {combo: 0.0 for combo in plans}
+        for combo in plans:
+            items[combo] = []
+        try:
+            for (combo, _), page, units in self.iter_pages(self.price_table, 'query', jobs):
+                capacity[combo] += units
+                if page is not None:
+                    items[combo].extend(page)
+                    continue
+                pending[combo] -= 1
+                if not pending[combo]:
+                    log_price_plan(f"matrix {location}#{combo[0]}#1#{combo[1]} {scraped_date_str}",
+                                   plans[combo], len(items[combo]), capacity[combo])
+                    if progress:
+                        progress(combo[0], combo[1], len(items[combo]))
+        except Exception as e:
+            raise RuntimeError(f"DynamoDB query error: {e}") from e
+
+        frames = [
+            items_to_frame(items[combo]).assign(persons=combo[0], time=combo[1])
+            for combo in combos
+        ]
+        df = concat_price_frames(frames).rename(columns={"price_date": "checkin_date"})
+        df = df.astype({"persons": "int16"})
+        df["time"] = pd.Categorical(df["time"].astype(str), categories=list(times))
+        return df[["name", "price", "checkin_date", "hotel_url", "review_score", "city",
+                   "distance", "breakfast_included", "free_cancellation", "persons", "time"]]
+
+    def newest_scraped_date(self, location: str, persons, time_val: str) -> str:
+        """Newest scraped_date of the matrix partition (nights=1), from a Limit=1 descending key probe."""
+        sort_key = 'scraped_date#hotel_id#checkin_date#checkout_date'
+        resp = self.table(self.price_table).query(
+            KeyConditionExpression=Key('location#persons#nights#time').eq(f"{location}#{persons}#1#{time_val}"),
+            ScanIndexForward=False,
+            Limit=1,
+            ProjectionExpression='#sk',
+            ExpressionAttributeNames={'#sk': sort_key}
+        )
+        items = resp.get('Items', [])
+        return items[0][sort_key].split('#')[0] if items else ""
+
+    def matrix_cache_key(self, location: str, zone_hotels: list, persons_list: list, times: list,
+                         start_date, days_forward: int, filter_desc: str, fmt: str):
+        """Cache key of one matrix request, or None when a newest-scrape probe fails."""
+        try:
+            newest = [[int(persons), time_val, self.newest_scraped_date(location, persons, time_val)]
+                      for persons in persons_list for time_val in times]
+        except Exception as e:
+            log.warning("matrix cache probe failed for %s: %s", location, e)
+            return None
+        return matrix_cache.fingerprint(
+            location=location, zone_hotels=sorted(zone_hotels),
+            start_date=start_date.strftime("%Y-%m-%d"), days_forward=int(days_forward),
+            filter_desc=filter_desc, fmt=fmt, newest_scraped_dates=newest,
+        )
+
+    def zone_hotels(self, zone_name: str, location: str):
+        """Hotel list of a MickeZones zone (PK 'zone_name#location'), or None when it does not exist."""
+        item = self.table('MickeZones').get_item(
+            Key={'zone_name#location': f"{zone_name}#{location}"}
+        ).get('Item')
+        return item.get('hotels', []) if item else None
+
+
+# ==================== MATRIX RUN ====================
+# A run is described by a params dict (the same one stored on dashboard jobs):
+#   location, zone, zone_hotels, persons [int], times [str], start_date
+#   'YYYY-MM-DD', days_forward, filter_mode, breakfast, free_cancel, format,
+#   recipients
+
+def build_matrix_file(store: PriceStore, cache, params: dict, progress=None) -> tuple:
+    """
+    Reuse a cached file or query, zone-filter, breakfast/cancellation-filter
+    and build one matrix. `cache` is a MatrixArtifactCache or None. Returns
+    (file bytes, meta, artifact_key). Raises ValueError when there is
+    nothing to build and RuntimeError on DynamoDB errors.
+    """
+    progress     = progress or (lambda message: None)
+    persons_list = [int(p) for p in params['persons']]
+    times        = list(params['times'])
+    start_dt     = datetime.strptime(params['start_date'], "%Y-%m-%d")
+    days_forward = int(params['days_forward'])
+    zone_hotels  = list(params['zone_hotels'])
+    fmt          = params['format']
+    apply_filter = params['filter_mode'] == "Apply filters"
+    breakfast    = bool(params.get('breakfast'))
+    free_cancel  = bool(params.get('free_cancel'))
+    filter_desc  = filter_desc_from_flags(breakfast, free_cancel) if apply_filter else "all"
+
+    key = store.matrix_cache_key(params['location'], zone_hotels, persons_list, times, start_dt,
+                                 days_forward, filter_desc, fmt) if cache else None
+    cached = cache.get(key) if key else None
+    if cached is not None:
+        progress("Reusing a matrix built since the last scrape")
+        data, meta = cached
+        return data, dict(meta, from_cache=True), key
+
+    progress(f"Querying {len(persons_list) * len(times)} persons / scrape-time combination(s)")
+    t0 = time.perf_counter()
+    df_raw = store.query_matrix_data(
+        location=params['location'],
+        persons_list=persons_list,
+        times=times,
+        start_date=start_dt,
+        days_forward=days_forward,
+        progress=lambda p, t, n: progress(f"{p} person{'s' if p > 1 else ''} / {t}: {n:,} records")
+    )
+    query_secs = time.perf_counter() - t0
+    if df_raw.empty:
+        raise ValueError("No data found for the selected scrape date and options. "
+                         "Check the scraper has run on this date for this location and time.")
+
+    df_raw  = df_raw.dropna(subset=["price"])
+    df_zone = df_raw[df_raw["name"].isin(zone_hotels)]
+    if df_zone.empty:
+        raise ValueError("None of the zone hotels have data for the selected scrape date.")
+
+    df_excel = df_zone
+    if apply_filter:
+        df_excel = df_zone[(df_zone["breakfast_included"] == breakfast) &
+                           (df_zone["free_cancellation"] == free_cancel)]
+        if df_excel.empty:
+            raise ValueError("No records match the selected filters. Try different filter options.")
+
+    progress(f"Building {matrix_excel.EXPORT_FORMATS[fmt][0]} from {len(df_excel):,} records")
+    t0   = time.perf_counter()
+    data = matrix_excel.export_matrix(
+        df_excel, persons_list, fmt=fmt,
+        single_sheet=filter_desc.replace("_", " + ") if apply_filter else None,
+    )
+    meta = {
+        "filter_desc":       filter_desc,
+        "found_hotels":      int(df_zone["name"].nunique()),
+        "total_zone_hotels": len(zone_hotels),
+        "records":           len(df_excel),
+        "query_secs":        round(query_secs, 2),
+        "build_secs":        round(time.perf_counter() - t0, 2),
+        "built_at":          datetime.now(FINLAND_TZ).strftime("%d/%m/%Y %H:%M"),
+    }
+    key = key or matrix_cache.fingerprint(job_params=params, built_at=meta["built_at"])
+    if cache:
+        cache.put(key, data, meta)
+    return data, dict(meta, from_cache=False), key
+
+
+def matrix_file_name(params: dict, filter_desc: str) -> str:
+    _, ext, _ = matrix_excel.EXPORT_FORMATS[params['format']]
+    return (
+        f"price_matrix_{params['location']}_"
+        f"{params['zone'].replace(' ', '_')}_"
+        f"{params['start_date'].replace('-', '')}_"
+        f"{'+'.join(params['times'])}_"
+        f"{filter_desc}.{ext}"
+    )
+
+
+def matrix_email(params: dict, meta: dict) -> tuple:
+    """(subject, body) of the email carrying one matrix."""
+    start_str   = datetime.strptime(params['start_date'], "%Y-%m-%d").strftime('%d/%m/%Y')
+    persons_str = "+".join(f"{int(p)}p" for p in params['persons'])
+    times_str   = "+".join(params['times'])
+    subject = (
+        f"Hotel Price Matrix – {params['location'].title()} | "
+        f"{params['zone']} | {persons_str} | "
+        f"{times_str.title()} | "
+        f"{start_str}"
+    )
+    body = (
+        f"Please find attached the hotel price matrix.\n\n"
+        f"Location  : {params['location'].title()}\n"
+        f"Zone      : {params['zone']}\n"
+        f"Persons   : {persons_str}\n"
+        f"Scrape    : {times_str}\n"
+        f"Start date: {start_str}\n"
+        f"Days fwd  : {int(params['days_forward'])}\n"
+        f"Filter    : {meta['filter_desc'].replace('_', ' + ')}\n"
+        f"Hotels    : {meta['found_hotels']} of "
+        f"{meta['total_zone_hotels']} in zone\n"
+        f"Generated : "
+        f"{datetime.now().strftime('%d/%m/%Y %H:%M')}\n\n"
+        f"Sent from the Hotel Dashboard."
+    )
+    return subject, body
+
+
+def send_matrix_email(smtp: mailer.Mailer, sender: str, recipients: list, subject: str, body: str,
+                      data: bytes, filename: str, mime: str = matrix_excel.XLSX_MIME) -> float:
+    """Send the matrix file as attachment through a pooled Mailer. Returns the delivery latency."""
+    msg            = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"]    = sender
+    msg["To"]      = ", ".join(recipients)
+    msg.set_content(body)
+
+    maintype, subtype = mime.split("/", 1)
+    msg.add_attachment(
+        data,
+        maintype=maintype,
+        subtype=subtype,
+        filename=filename
+    )
+
+    latency = smtp.send(msg, timeout=MAIL_SEND_TIMEOUT)
+    log.info("matrix email to %d recipient(s) delivered in %.2fs", len(recipients), latency)
+    return latency
+
+
+# ==================== AUTOMATIONS ====================
+
+def automation_params(item: dict, zone_hotels: list, start_date: str = None) -> dict:
+    """Run params for a MickeAutomations item; the scrape date defaults to today in Finland."""
+    return {
+        'location':     item['location'],
+        'zone':         item['zone'],
+        'zone_hotels':  list(zone_hotels),
+        'persons':      [int(item['persons'])],
+        'times':        [item['time_val']],
+        'start_date':   start_date or datetime.now(FINLAND_TZ).strftime("%Y-%m-%d"),
+        'days_forward': int(item['days_forward']),
+        'filter_mode':  item.get('filter_mode', "All data (no filter)"),
+        'breakfast':    bool(item.get('filter_breakfast', False)),
+        'free_cancel':  bool(item.get('filter_free_cancel', False)),
+        'format':       item.get('export_format', 'xlsx'),
+        'recipients':   list(item.get('recipients', [])),
+    }
+
+
+def run_automation(store: PriceStore, automation_id: str, cache=None, smtp: mailer.Mailer = None,
+                   sender: str = None, start_date: str = None, out: str = None) -> dict:
+    """
+    Build one automation's matrix and email it (skipped when `smtp` is None),
+    then record last_run / last_status on the automation. `out` also writes
+    the file to disk. Returns the run's meta with filename, size and timings.
+    """
+    automations = store.table('MickeAutomations')
+    item = automations.get_item(Key={'automation_id': automation_id}).get('Item')
+    if item is None:
+        raise ValueError(f"No automation {automation_id!r}")
+    zone_hotels = store.zone_hotels(item['zone'], item['location'])
+    if zone_hotels is None:
+        raise ValueError(f"Zone {item['zone']!r} not found for {item['location']}")
+    params = automation_params(item, zone_hotels, start_date)
+
+    status = 'success'
+    try:
+        data, meta, _ = build_matrix_file(store, cache, params,
+                                          progress=lambda message: log.info("%s: %s", automation_id, message))
+        filename = matrix_file_name(params, meta["filter_desc"])
+        result   = dict(meta, filename=filename, size_bytes=len(data))
+        if out:
+            with open(out, "wb") as fh:
+                fh.write(data)
+        if smtp is not None:
+            subject, body = matrix_email(params, meta)
+            t0 = time.perf_counter()
+            send_matrix_email(smtp, sender, params['recipients'], subject, body, data, filename,
+                              mime=matrix_excel.EXPORT_FORMATS[params['format']][2])
+            result["send_secs"] = round(time.perf_counter() - t0, 2)
+        return result
+    except Exception as e:
+        status = f"failed: {e}"
+        raise
+    finally:
+        if smtp is not None:
+            automations.update_item(
+                Key={'automation_id': automation_id},
+                UpdateExpression="SET last_run = :r, last_status = :s",
+                ExpressionAttributeValues={':r': datetime.now(FINLAND_TZ).isoformat(), ':s': status[:200]}
+            )
+
+
+# ==================== CLI / LAMBDA ====================
+
+def _load_env():
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+
+
+def store_from_env() -> PriceStore:
+    return PriceStore(os.environ.get("AWS_ACCESS_KEY_ID"), os.environ.get("AWS_SECRET_ACCESS_KEY"),
+                      os.environ.get("AWS_DEFAULT_REGION"),
+                      mirror_dir=os.environ.get("HOTEL_MIRROR_DIR", ""))
+
+
+def cache_from_env():
+    root = os.environ.get("MATRIX_CACHE_DIR", "")
+    return matrix_cache.MatrixArtifactCache(root, MATRIX_CACHE_MAX_BYTES) if root else None
+
+
+def mailer_from_env() -> mailer.Mailer:
+    return mailer.Mailer("smtp.gmail.com", 587,
+                         os.environ["GMAIL_SENDER"], os.environ["GMAIL_APP_PASSWORD"])
+
+
+def lambda_handler(event, context=None):
+    """EventBridge schedule target: {"automation_id": ...}."""
+    _load_env()
+    smtp = mailer_from_env()
+    try:
+        result = run_automation(store_from_env(), event['automation_id'], cache=cache_from_env(),
+                                smtp=smtp, sender=os.environ["GMAIL_SENDER"])
+    finally:
+        smtp.close()
+    return {'automation_id': event['automation_id'], **result}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m matrix_pipeline",
+                                     description="Build and send price matrices without the dashboard.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run-automation", help="build one automation's matrix and email it")
+    p_run.add_argument("automation_id")
+    p_run.add_argument("--date", help="scrape / start date (YYYY-MM-DD); default today")
+    p_run.add_argument("--out", help="also write the file here")
+    p_run.add_argument("--no-send", action="store_true", help="build only; do not email or update the automation")
+    p_run.add_argument("--no-cache", action="store_true", help="ignore MATRIX_CACHE_DIR and always rebuild")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    _load_env()
+
+    smtp = None if args.no_send else mailer_from_env()
+    t0 = time.perf_counter()
+    try:
+        result = run_automation(store_from_env(), args.automation_id,
+                                cache=None if args.no_cache else cache_from_env(),
+                                smtp=smtp, sender=os.environ.get("GMAIL_SENDER"),
+                                start_date=args.date, out=args.out)
+    finally:
+        if smtp is not None:
+            smtp.close()
+
+    source = "from cache" if result["from_cache"] else (
+        f"query {result['query_secs']:.2f}s, build {result['build_secs']:.2f}s")
+    print(f"{result['filename']}: {result['size_bytes'] / 1024:,.0f} KB, "
+          f"{result['found_hotels']} / {result['total_zone_hotels']} hotels, {source}"
+          + (f", send {result['send_secs']:.2f}s" if "send_secs" in result else "")
+          + f"; total {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
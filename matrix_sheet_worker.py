@@ -0,0 +1,36 @@
+"""
+Sheet render worker for matrix_excel's parallel workbook build.
+
+matrix_excel starts one of these per worker slot as
+
+    python -m matrix_sheet_worker
+
+and sends it pickled sheet jobs on stdin; each reply on stdout is a pickled
+(ok, result) pair — the rendered sheet parts, or the exception raised. The
+worker exits when stdin closes. Only the writer is imported here, never the
+parent's __main__.
+"""
+import pickle
+import sys
+
+import matrix_excel
+
+
+def main():
+    jobs, replies = sys.stdin.buffer, sys.stdout.buffer
+    sys.stdout = sys.stderr     # stray prints must not corrupt the reply stream
+    while True:
+        try:
+            job = pickle.load(jobs)
+        except EOFError:
+            return
+        try:
+            reply = (True, matrix_excel._render_sheet(job))
+        except Exception as e:
+            reply = (False, e)
+        pickle.dump(reply, replies, protocol=pickle.HIGHEST_PROTOCOL)
+        replies.flush()
+
+
+if __name__ == "__main__":
+    main()